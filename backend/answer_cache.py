@@ -0,0 +1,130 @@
+# answer_cache.py
+"""Cache of AI tutor answers to standalone questions.
+
+Many students open with the same questions ("what is recursion?",
+"Explain closures please"). Such questions are reduced to a key of their
+content words in their original order, with question words, filler and
+plurals removed, so those two phrasings become "recursion" and "closure".
+``+`` and ``#`` are kept, so C, C++ and C# get different keys. Questions
+with digits or operators ("what is 2*3?") are never cached: dropping one
+symbol would turn them into a different question with the same key.
+
+Only exact key matches are served. Near-matches are not: concepts that
+differ by a prefix or one letter ("supervised" and "unsupervised learning",
+"mitosis" and "meiosis") look alike to any character-level similarity but
+need different answers:
+
+    >>> question_key("What is unsupervised learning?") == question_key("supervised learning")
+    False
+    >>> question_key("Explain meiosis") == question_key("what is mitosis")
+    False
+    >>> question_key("asynchronous programming") == question_key("synchronous programming")
+    False
+    >>> question_key("What is denormalization?") == question_key("normalization")
+    False
+    >>> question_key("What are closures?") == question_key("Explain closures please")
+    True
+
+Only standalone questions are cached: the conversation history must be
+short, and with any history at all the question may not refer back to it
+("explain that again", "give another example"). Entries expire after a
+TTL, and the least recently used ones are evicted first.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from similarity import normalize_text
+
+_NON_WORD = re.compile(r"[^\w+#]+")   # like normalize_topic: keeps C++ and C#
+_UNCACHEABLE = re.compile(r"[\d*/=<>^%]")
+
+# Words that do not change what is being asked
+STOPWORDS = frozenset("""
+a an the and or of in on at for to with by from as into about
+is are was were be been being do does did can could would will should shall may might
+what whats which who whom how why when where
+i me my we our you your u please pls kindly hey hi hello thanks thank
+explain explanation describe define definition meaning mean means tell give show teach
+help understand know learn simple simply basic basics briefly brief short terms word words
+it its some any between vs versus
+""".split())
+
+# With prior turns present, these suggest the question depends on them
+FOLLOW_UP = frozenset("""
+it its this that these those they them their above previous earlier last again
+more another also else further elaborate continue example examples same instead
+""".split())
+
+
+def _stem(word):
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def question_key(text):
+    """Stemmed content words in order: 'What are closures?' -> 'closure'; '' if not cacheable."""
+    if _UNCACHEABLE.search(text):
+        return ""
+    words = [_stem(w) for w in _NON_WORD.sub(" ", text.lower()).split() if w not in STOPWORDS]
+    return " ".join(dict.fromkeys(words))  # drop repeats, keep order
+
+
+def is_standalone(question, history, max_history=2, max_words=30):
+    """True if the answer to ``question`` does not depend on the conversation."""
+    words = normalize_text(question).split()
+    if not words or len(words) > max_words or len(history) > max_history:
+        return False
+    return not (history and FOLLOW_UP.intersection(words))
+
+
+class TutorAnswerCache:
+    """TTL + LRU cache of answers, matched by exact content-word key."""
+
+    def __init__(self, max_entries=5000, ttl=86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (answer, added_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, question):
+        """Return the cached answer for ``question`` or one with the same key, else None."""
+        key = question_key(question)
+        if not key:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def add(self, question, answer):
+        key = question_key(question)
+        if not key or not answer or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (answer, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
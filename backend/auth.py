@@ -0,0 +1,147 @@
+# auth.py
+"""Signed, expiring session tokens.
+
+A token is ``<user_id>.<expires>.<nonce>.<signature>``, where the signature
+is an HMAC-SHA256 of the first three parts under AUTH_SECRET. Checking one
+needs no database lookup, so the cost per request stays the same however
+many users there are. Recently verified tokens are kept in a small LRU to
+skip the HMAC, and logged-out tokens are remembered (until they would have
+expired anyway) so they are rejected.
+
+Revocations are held per process. With several workers, set the same
+AUTH_SECRET everywhere and keep AUTH_TOKEN_TTL short.
+
+Environment:
+    AUTH_SECRET                 signing key; a random one is generated per process if unset
+    AUTH_TOKEN_TTL              token lifetime in seconds (default: 86400)
+    AUTH_REQUIRED               set to 0 to let anonymous clients use the AI endpoints (default: 1)
+    AUTH_VERIFY_CACHE_SIZE      verified tokens remembered (default: 10000)
+    AUTH_REVOKED_CACHE_SIZE     logged-out tokens remembered (default: 100000)
+"""
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+logger = logging.getLogger(__name__)
+
+AUTH_SECRET = os.getenv("AUTH_SECRET")
+if not AUTH_SECRET:
+    logger.warning("AUTH_SECRET is not set; using a random key, tokens will not survive a restart")
+    AUTH_SECRET = secrets.token_hex(32)
+
+TOKEN_TTL = int(os.getenv("AUTH_TOKEN_TTL", "86400"))
+AUTH_REQUIRED = os.getenv("AUTH_REQUIRED", "1") != "0"
+
+
+def _sign(message):
+    digest = hmac.new(AUTH_SECRET.encode("utf-8"), message.encode("utf-8"), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def issue_token(user_id, ttl=None):
+    """Return (token, expires_at) for ``user_id``."""
+    expires = int(time.time()) + (ttl or TOKEN_TTL)
+    body = f"{int(user_id)}.{expires}.{secrets.token_urlsafe(9)}"
+    return f"{body}.{_sign(body)}", expires
+
+
+class TokenVerifier:
+    """Checks token signatures and expiry, with an LRU of results and revocations."""
+
+    def __init__(self, cache_size=10000, revoked_size=100000):
+        self.cache_size = cache_size
+        self.revoked_size = revoked_size
+        self._verified = OrderedDict()  # token -> (user_id, expires)
+        self._revoked = OrderedDict()   # token -> expires
+        self._lock = threading.Lock()
+
+    def _parse(self, token):
+        try:
+            user_id, expires, nonce, signature = token.split(".")
+            body = f"{user_id}.{expires}.{nonce}"
+            # Compare bytes: compare_digest rejects non-ASCII str with TypeError
+            if not hmac.compare_digest(signature.encode("utf-8"), _sign(body).encode("ascii")):
+                return None
+            return int(user_id), int(expires)
+        except ValueError:
+            return None
+
+    def verify(self, token) -> Optional[int]:
+        """Return the user id for a valid, unexpired, unrevoked token, else None."""
+        if not token:
+            return None
+        now = time.time()
+        with self._lock:
+            if token in self._revoked:
+                return None
+            entry = self._verified.get(token)
+            if entry is not None:
+                self._verified.move_to_end(token)
+        if entry is None:
+            entry = self._parse(token)
+            if entry is None:
+                return None
+            with self._lock:
+                self._verified[token] = entry
+                while len(self._verified) > self.cache_size:
+                    self._verified.popitem(last=False)
+        user_id, expires = entry
+        if expires <= now:
+            with self._lock:
+                self._verified.pop(token, None)
+            return None
+        return user_id
+
+    def revoke(self, token):
+        entry = self._parse(token) if token else None
+        if entry is None:
+            return False
+        now = time.time()
+        with self._lock:
+            self._verified.pop(token, None)
+            self._revoked[token] = entry[1]
+            # Expired tokens fail verification anyway, so they can be forgotten
+            while self._revoked:
+                _, oldest_expiry = next(iter(self._revoked.items()))
+                if oldest_expiry > now and len(self._revoked) <= self.revoked_size:
+                    break
+                self._revoked.popitem(last=False)
+        return True
+
+
+verifier = TokenVerifier(
+    cache_size=int(os.getenv("AUTH_VERIFY_CACHE_SIZE", "10000")),
+    revoked_size=int(os.getenv("AUTH_REVOKED_CACHE_SIZE", "100000")),
+)
+
+
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    if authorization and authorization.lower().startswith("bearer "):
+        return authorization[7:].strip()
+    return None
+
+
+async def get_current_user(authorization: Optional[str] = Header(None)) -> Optional[int]:
+    """FastAPI dependency returning the caller's user id.
+
+    Raises 401 for missing or invalid tokens unless AUTH_REQUIRED is off,
+    in which case anonymous callers get None.
+    """
+    token = bearer_token(authorization)
+    user_id = verifier.verify(token)
+    if user_id is None and (token or AUTH_REQUIRED):
+        raise HTTPException(
+            status_code=401,
+            detail="Please sign in again." if token else "Not signed in.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user_id
@@ -0,0 +1,196 @@
+# benchmark.py
+"""Load-test the API in-process and report latency percentiles as JSON.
+
+Drives /register, /login, /ai-questions, /ai-tutor and /quiz-feedback
+concurrently through httpx's ASGI transport, so no server or network is
+involved. The LLM is replaced by the offline stub provider (providers.py)
+with a configurable latency, and the app runs against a throwaway SQLite
+database. Per-user and global rate limits are switched off so they do not
+cap the measurement, and so is the tutor answer cache, so ai-tutor measures
+real (stub) LLM calls rather than cache hits.
+
+Usage (from backend/):
+    python benchmark.py --requests 200 --concurrency 20 --output bench.json
+    python benchmark.py --scenarios login,ai-tutor --llm-latency-ms 500
+
+Each scenario reports requests, errors, status codes, throughput (req/s)
+and p50/p95/p99/mean/max latency in milliseconds.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+SCENARIOS = ("register", "login", "ai-questions", "ai-tutor", "quiz-feedback")
+TOPICS = ("Photosynthesis", "World War II", "Linear Algebra", "Python Programming",
+          "The Water Cycle", "Supply and Demand", "Cell Biology", "Ancient Rome")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, min(len(sorted_values), round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, statuses, duration, concurrency):
+    latencies = sorted(latencies)
+    counts = {}
+    for status in statuses:
+        counts[str(status)] = counts.get(str(status), 0) + 1
+    ms = lambda value: round(value * 1000, 2) if value is not None else None  # noqa: E731
+    return {
+        "requests": len(statuses),
+        "concurrency": concurrency,
+        "errors": sum(1 for s in statuses if not isinstance(s, int) or s >= 400),
+        "status_counts": counts,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(statuses) / duration, 2) if duration > 0 else None,
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 50)),
+            "p95": ms(percentile(latencies, 95)),
+            "p99": ms(percentile(latencies, 99)),
+            "mean": ms(sum(latencies) / len(latencies)) if latencies else None,
+            "max": ms(latencies[-1]) if latencies else None,
+        },
+    }
+
+
+async def run_scenario(make_request, total, concurrency):
+    """Send ``total`` requests with at most ``concurrency`` in flight."""
+    latencies, statuses = [], []
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                response = await make_request(i)
+                status = response.status_code
+                await response.aread()
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses.append(status)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, statuses, time.perf_counter() - started, concurrency)
+
+
+async def run(args):
+    import httpx
+    import main as app_module  # imported here so the environment set in configure() applies
+
+    app = app_module.app
+    transport = httpx.ASGITransport(app=app)
+    results = {}
+    # ASGITransport does not send lifespan events, so run startup/shutdown here
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        # Users for the login and AI scenarios, created outside the measurement
+        password = "benchmark-password"
+        users = []
+        for i in range(args.users):
+            email = f"bench-user-{i}@example.com"
+            response = await client.post("/register", json={"name": f"Bench {i}", "email": email, "password": password})
+            if response.status_code != 200:
+                response = await client.post("/login", json={"email": email, "password": password})
+            users.append((email, response.json()["token"]))
+        auth = lambda i: {"Authorization": f"Bearer {users[i % len(users)][1]}"}  # noqa: E731
+        run_id = int(time.time())
+
+        requests = {
+            "register": lambda i: client.post("/register", json={
+                "name": f"New {i}", "email": f"bench-new-{run_id}-{i}@example.com", "password": password}),
+            "login": lambda i: client.post("/login", json={"email": users[i % len(users)][0], "password": password}),
+            "ai-questions": lambda i: client.post("/ai-questions", headers=auth(i), json={
+                "topic": TOPICS[i % min(args.topics, len(TOPICS))], "num_questions": 5, "attempt": i // len(TOPICS) + 1}),
+            "ai-tutor": lambda i: client.post("/ai-tutor", headers=auth(i), json={
+                "question": f"Can you explain {TOPICS[i % len(TOPICS)]} with an example?",
+                "conversation_history": [], "conversation_id": f"bench-{i}"}),
+            "quiz-feedback": lambda i: client.post("/quiz-feedback", headers=auth(i), json={
+                "score": i % 6, "total": 5, "topic": TOPICS[i % len(TOPICS)]}),
+        }
+        for name in args.scenarios:
+            print(f"⏱️  {name}: {args.requests} requests, concurrency {args.concurrency}", file=sys.stderr)
+            results[name] = await run_scenario(requests[name], args.requests, args.concurrency)
+
+    return results
+
+
+def configure(args):
+    """Point the app at the stub provider and a scratch database before import."""
+    os.environ["LLM_PROVIDER"] = "stub"
+    os.environ["LLM_STUB_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["LLM_STUB_JITTER_MS"] = str(args.llm_jitter_ms)
+    os.environ["LLM_STUB_FAILURE_RATE"] = str(args.llm_failure_rate)
+    os.environ["LLM_STUB_SEED"] = str(args.seed)
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.database}"
+    os.environ.setdefault("AUTH_SECRET", "benchmark-secret")
+    os.environ["TUTOR_CACHE_MAX_ENTRIES"] = "0"
+    os.environ["RATE_LIMIT_USER_PER_MINUTE"] = "0"
+    os.environ["LLM_REQUESTS_PER_MINUTE"] = "0"
+    os.environ["LLM_TOKENS_PER_MINUTE"] = "0"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20, help="requests in flight per scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--users", type=int, default=20, help="pre-registered users the requests rotate through")
+    parser.add_argument("--topics", type=int, default=4, help="distinct quiz topics (max %d)" % len(TOPICS))
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--llm-jitter-ms", type=float, default=50)
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database", default=None, help="SQLite file to use (default: a temporary file)")
+    parser.add_argument("--output", default=None, help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory() as tmp:
+        args.database = args.database or os.path.join(tmp, "benchmark.db")
+        configure(args)
+        # The app logs to stdout; keep stdout for the JSON report
+        with contextlib.redirect_stdout(sys.stderr):
+            results = asyncio.run(run(args))
+    report = {
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "topics": args.topics,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_jitter_ms": args.llm_jitter_ms,
+            "llm_failure_rate": args.llm_failure_rate,
+            "seed": args.seed,
+            "python": platform.python_version(),
+        },
+        "scenarios": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"✅ Wrote benchmark report to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
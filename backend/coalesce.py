@@ -0,0 +1,114 @@
+# coalesce.py
+"""Single-flight de-duplication of identical concurrent work.
+
+When many clients ask for the same thing at once (a class generating a quiz
+on the same topic), only the first request starts the work; the others
+attach to it and receive the same result.
+
+The shared work runs in its own task, so the request that started it can
+disconnect without cancelling it for everyone else.
+"""
+import asyncio
+
+
+class SharedStream:
+    """A replayable stream of items fanned out to any number of subscribers."""
+
+    def __init__(self):
+        self.items = []
+        self.done = False
+        self.error = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, item):
+        async with self._changed:
+            self.items.append(item)
+            self._changed.notify_all()
+
+    async def finish(self, error=None):
+        async with self._changed:
+            self.done = True
+            self.error = error
+            self._changed.notify_all()
+
+    async def subscribe(self):
+        """Yield every item from the start, then new ones until the stream ends."""
+        index = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: index < len(self.items) or self.done)
+                pending = self.items[index:]
+                done, error = self.done, self.error
+            for item in pending:
+                yield item
+            index += len(pending)
+            if done and index >= len(self.items):
+                if error is not None:
+                    raise error
+                return
+
+
+class SingleFlight:
+    """Tracks in-flight work by key so identical calls share one execution."""
+
+    def __init__(self):
+        self._calls = {}    # key -> asyncio.Task
+        self._streams = {}  # key -> SharedStream
+        self.started = 0
+        self.joined = 0
+
+    def in_flight(self):
+        return len(self._calls) + len(self._streams)
+
+    def keys(self):
+        """Keys of the calls and streams currently running."""
+        return list(self._calls) + list(self._streams)
+
+    async def do(self, key, fn):
+        """Await ``fn()``, or the already running call for ``key``.
+
+        Returns (result, shared) where shared is True for requests that
+        joined an existing call. A ``None`` key disables coalescing.
+        """
+        if key is None:
+            return await fn(), False
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self.joined += 1
+        else:
+            self.started += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task), shared
+
+    def stream(self, key, producer):
+        """Subscribe to the stream for ``key``, starting ``producer()`` if needed.
+
+        ``producer`` is a zero-argument callable returning an async iterator.
+        Returns (async iterator over all items, shared).
+        """
+        if key is None:
+            return producer(), False
+        stream = self._streams.get(key)
+        shared = stream is not None
+        if shared:
+            self.joined += 1
+        else:
+            self.started += 1
+            stream = self._streams[key] = SharedStream()
+            task = asyncio.ensure_future(self._pump(key, stream, producer))
+            stream.task = task  # keep a reference so the task is not collected
+        return stream.subscribe(), shared
+
+    async def _pump(self, key, stream, producer):
+        try:
+            async for item in producer():
+                await stream.publish(item)
+        except Exception as e:
+            await stream.finish(error=e)
+        else:
+            await stream.finish()
+        finally:
+            self._streams.pop(key, None)
@@ -0,0 +1,289 @@
+# corpus.py
+"""Streaming export and import of the question bank.
+
+The corpus is gzip-compressed JSONL, one question per line:
+
+    {"hash": "...", "topic_key": "python lists", "style": "...", "difficulty": "Easy",
+     "question": "...", "options": [...], "correct_answer": "...", "explanation": "..."}
+
+Both directions run in constant memory. Export pages through the table by
+id, CORPUS_BATCH_SIZE rows at a time, and compresses each page as it goes.
+Import decompresses a bounded slice of input at a time and inserts one
+batch per transaction. Plain (uncompressed) JSONL is accepted too.
+
+A question's content hash covers its topic, normalized text, options and
+answer. Import skips lines whose hash is already in the bank, or earlier in
+the same file, so re-importing a corpus is a no-op. Imported questions
+start with a serve count of zero.
+
+Usage (from backend/):
+    python corpus.py export questions.jsonl.gz
+    python corpus.py import questions.jsonl.gz
+
+Environment:
+    CORPUS_BATCH_SIZE  rows per export page and per import transaction (default: 500)
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import zlib
+
+from sqlalchemy import insert
+
+from models import Question
+from quiz_parser import validate_question
+from similarity import normalize_text
+
+BATCH_SIZE = int(os.getenv("CORPUS_BATCH_SIZE", "500"))
+MAX_LINE_BYTES = 1 << 20    # longer lines are counted as invalid and skipped
+DECOMPRESS_SLICE = 1 << 16  # bytes of output per decompress call
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def content_hash(topic_key, question, options, correct_answer):
+    """Hex SHA-256 identifying a question independent of punctuation and case."""
+    payload = json.dumps(
+        [topic_key or "", normalize_text(question or ""), [str(o).strip() for o in options or []],
+         str(correct_answer or "").strip()],
+        ensure_ascii=False, separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def question_hash(row):
+    return content_hash(row.topic_key, row.question, json.loads(row.options or "[]"), row.correct_answer)
+
+
+def backfill_hashes(session_factory, batch_size=BATCH_SIZE):
+    """Hash bank questions stored before content_hash existed. Returns the number updated."""
+    updated = 0
+    db = session_factory()
+    try:
+        while True:
+            rows = db.query(Question).filter(Question.content_hash.is_(None)).limit(batch_size).all()
+            if not rows:
+                return updated
+            for row in rows:
+                row.content_hash = question_hash(row)
+            db.commit()
+            updated += len(rows)
+    finally:
+        db.close()
+
+
+# ------------------ Export ------------------
+def export_lines(session_factory, max_serves=None, batch_size=BATCH_SIZE):
+    """Yield one JSON line (bytes) per bank question, reading batch_size rows at a time."""
+    last_id = 0
+    while True:
+        db = session_factory()
+        try:
+            query = db.query(Question).filter(Question.id > last_id)
+            if max_serves is not None:
+                query = query.filter(Question.serve_count < max_serves)
+            rows = query.order_by(Question.id).limit(batch_size).all()
+        finally:
+            db.close()
+        if not rows:
+            return
+        for row in rows:
+            yield (json.dumps({
+                "hash": row.content_hash or question_hash(row),
+                "topic_key": row.topic_key,
+                "style": row.style,
+                "difficulty": row.difficulty,
+                "question": row.question,
+                "options": json.loads(row.options or "[]"),
+                "correct_answer": row.correct_answer,
+                "explanation": row.explanation or "",
+            }, ensure_ascii=False) + "\n").encode()
+        last_id = rows[-1].id
+
+
+def export_gzip(session_factory, max_serves=None, batch_size=BATCH_SIZE):
+    """Yield the gzip-compressed corpus in chunks."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    pending = []
+    for line in export_lines(session_factory, max_serves, batch_size):
+        pending.append(line)
+        if len(pending) >= batch_size:
+            chunk = compressor.compress(b"".join(pending))
+            pending = []
+            if chunk:
+                yield chunk
+    yield compressor.compress(b"".join(pending)) + compressor.flush()
+
+
+# ------------------ Import ------------------
+def _check_types(record):
+    """Raise ValueError unless every stored field has the type the bank expects."""
+    if not isinstance(record.get("topic_key"), str) or not record["topic_key"]:
+        raise ValueError("Missing topic_key")
+    if not isinstance(record["question"], str) or not isinstance(record["correct_answer"], str):
+        raise ValueError("question and correct_answer must be strings")
+    if not all(isinstance(option, str) for option in record["options"]):
+        raise ValueError("options must be strings")
+    for field in ("style", "difficulty", "explanation"):
+        if record.get(field) is not None and not isinstance(record[field], str):
+            raise ValueError(f"{field} must be a string")
+
+
+class CorpusImporter:
+    """Incremental importer: ``feed`` raw bytes as they arrive, then ``close``."""
+
+    def __init__(self, session_factory, batch_size=BATCH_SIZE):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self._decompressor = None
+        self._started = False
+        self._buffer = b""
+        self._skipping = False  # inside an over-long line
+        self._batch = []
+        self.stats = {"read": 0, "imported": 0, "duplicates": 0, "invalid": 0}
+
+    def feed(self, data):
+        """Consume a chunk of the (possibly gzipped) stream. Blocking; may write to the database."""
+        if not data:
+            return
+        if not self._started:
+            self._started = True
+            if data[:2] == GZIP_MAGIC:
+                self._decompressor = zlib.decompressobj(47)  # gzip or zlib header
+        if self._decompressor is None:
+            self._add_text(data)
+            return
+        while data:
+            self._add_text(self._decompressor.decompress(data, DECOMPRESS_SLICE))
+            data = self._decompressor.unconsumed_tail
+            if self._decompressor.eof:
+                # Concatenated gzip files (cat a.gz b.gz): each member needs its own decompressor
+                data = self._decompressor.unused_data + data
+                self._decompressor = zlib.decompressobj(47)
+
+    def close(self):
+        """Flush what is left and return the counts."""
+        if self._decompressor is not None:
+            self._add_text(self._decompressor.flush())
+        if self._buffer.strip() and not self._skipping:
+            self._add_line(self._buffer)
+        self._buffer = b""
+        self._flush()
+        return self.stats
+
+    def _add_text(self, text):
+        self._buffer += text
+        while True:
+            end = self._buffer.find(b"\n")
+            if end < 0:
+                break
+            line, self._buffer = self._buffer[:end], self._buffer[end + 1:]
+            if self._skipping:
+                self._skipping = False
+            elif line.strip():
+                self._add_line(line)
+        if len(self._buffer) > MAX_LINE_BYTES:
+            if not self._skipping:
+                self.stats["read"] += 1
+                self.stats["invalid"] += 1
+            self._skipping = True
+            self._buffer = b""
+
+    def _add_line(self, line):
+        self.stats["read"] += 1
+        try:
+            record = json.loads(line)
+            validate_question(record)
+            _check_types(record)
+            record["hash"] = content_hash(
+                record["topic_key"], record["question"], record["options"], record["correct_answer"]
+            )
+        except (ValueError, TypeError, AttributeError):
+            self.stats["invalid"] += 1
+            return
+        self._batch.append(record)
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+        unique = {}
+        for record in batch:
+            unique.setdefault(record["hash"], record)
+        db = self.session_factory()
+        try:
+            existing = {
+                h for (h,) in db.query(Question.content_hash).filter(Question.content_hash.in_(list(unique)))
+            }
+            rows = [
+                {
+                    "question": record["question"],
+                    "correct_answer": record["correct_answer"],
+                    "topic_key": record["topic_key"],
+                    "style": record.get("style"),
+                    "difficulty": record.get("difficulty"),
+                    "options": json.dumps(record["options"]),
+                    "explanation": record.get("explanation") or "",
+                    "serve_count": 0,
+                    "content_hash": h,
+                }
+                for h, record in unique.items() if h not in existing
+            ]
+            if rows:
+                db.execute(insert(Question), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        self.stats["imported"] += len(rows)
+        self.stats["duplicates"] += len(batch) - len(rows)
+
+
+def import_file(session_factory, f, batch_size=BATCH_SIZE, chunk_size=1 << 16):
+    """Import a corpus from a binary file object; returns the counts."""
+    importer = CorpusImporter(session_factory, batch_size)
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return importer.close()
+        importer.feed(chunk)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("path", help="corpus file; '-' for stdout/stdin")
+    parser.add_argument("--max-serves", type=int, default=None,
+                        help="export only questions served fewer times than this")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    from database import SessionLocal, init_db
+    init_db()
+    backfill_hashes(SessionLocal, args.batch_size)
+    if args.command == "export":
+        out = sys.stdout.buffer if args.path == "-" else open(args.path, "wb")
+        try:
+            for chunk in export_gzip(SessionLocal, args.max_serves, args.batch_size):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        print(f"✅ Exported the question bank to {args.path}", file=sys.stderr)
+    else:
+        src = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+        try:
+            stats = import_file(SessionLocal, src, args.batch_size)
+        finally:
+            if src is not sys.stdin.buffer:
+                src.close()
+        print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
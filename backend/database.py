@@ -1,12 +1,122 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+# database.py
+"""Single storage layer for the backend.
 
-DATABASE_URL = "sqlite:///./quiz.db"
+One engine serves the whole app. SQLite connections are opened in WAL
+mode with ``synchronous=NORMAL`` and a busy timeout, so readers never block
+the writer and concurrent /register and /login writes wait for the lock
+instead of failing with "database is locked". Routes get a session per
+request from the ``get_db`` dependency.
+
+Every statement's execution time is recorded in the ``db`` stage of the
+metrics module, and ``database_status()`` backs the /health check.
+
+Environment:
+    DATABASE_URL            SQLAlchemy URL (default: sqlite:///app.db)
+    SQLITE_BUSY_TIMEOUT_MS  how long a writer waits for the lock (default: 5000)
+    DB_POOL_SIZE            pooled connections kept open (default: 10)
+    DB_MAX_OVERFLOW         extra connections allowed under load (default: 20)
+"""
+import os
+import time
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from metrics import STAGE_SECONDS
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///app.db")
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
 
 engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
+    DATABASE_URL,
+    connect_args={"check_same_thread": False} if IS_SQLITE else {},
+    poolclass=QueuePool,
+    pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+    pool_pre_ping=not IS_SQLITE,
 )
 
+if IS_SQLITE:
+    @event.listens_for(engine, "connect")
+    def _configure_sqlite(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))}")
+        cursor.close()
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_started", None)
+    if started is not None:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="db")
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
+
+
+def get_db():
+    """FastAPI dependency yielding a session that is closed after the request."""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def pool_status():
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+    }
+
+
+def database_status():
+    """Run a trivial query and report its latency along with the pool state."""
+    started = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        status = {"status": "connected", "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+    except Exception as e:
+        status = {"status": "error", "error": str(e)}
+    status["pool"] = pool_status()
+    return status
+
+
+def add_missing_columns():
+    """Add columns and indexes that create_all() skips on tables that already exist."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                conn.execute(text(ddl))
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+
+def init_db():
+    """Create all tables and bring existing ones up to the current schema."""
+    import models  # noqa: F401  (registers the models on Base)
+
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+
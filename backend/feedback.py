@@ -0,0 +1,86 @@
+# feedback.py
+"""Caching and templates for /quiz-feedback.
+
+Feedback only depends on the topic and how well the student did, so
+responses are memoized per (normalized topic, percentage bucket). Each key
+collects a few LLM-written variants before it stops calling the model and
+rotates through the cached ones, so repeat visitors do not always see the
+same sentence.
+
+Template mode skips the LLM entirely and fills a canned message for the
+score band.
+"""
+import random
+import threading
+from collections import OrderedDict
+
+TEMPLATES = {
+    "high": [
+        "Excellent work on {topic}! You scored {percentage}%, which shows a strong understanding of the material.",
+        "Great job! {percentage}% on {topic} means you have a solid grasp of the key ideas. Keep challenging yourself with harder questions.",
+        "Outstanding result on {topic}: {percentage}%. You clearly know this topic well.",
+    ],
+    "medium": [
+        "Good effort! You scored {percentage}% on {topic}. Review the explanations for the questions you missed and try again to improve.",
+        "Nice progress on {topic} with {percentage}%. You have the basics down; revisiting the tricky questions will push you higher.",
+        "You're on the right track with {topic} ({percentage}%). Go through the explanations once more and take another attempt.",
+    ],
+    "low": [
+        "Keep practicing! {percentage}% on {topic} is a starting point. Review the material and take your time with each question.",
+        "Don't be discouraged by {percentage}% on {topic}. Ask the AI Tutor about the concepts you found hard, then try a new quiz.",
+        "Every attempt helps you learn. Read through the explanations for {topic}, then give it another go.",
+    ],
+}
+
+
+def score_band(percentage):
+    if percentage >= 80:
+        return "high"
+    if percentage >= 60:
+        return "medium"
+    return "low"
+
+
+def percentage_bucket(percentage, width=10):
+    """Round a percentage down to its bucket, e.g. 67 -> 60 with width 10."""
+    return min(100, max(0, percentage)) // width * width
+
+
+def template_feedback(topic, percentage, rng=random):
+    return rng.choice(TEMPLATES[score_band(percentage)]).format(topic=topic, percentage=percentage)
+
+
+class FeedbackCache:
+    """LRU cache holding up to ``variants`` feedback messages per key."""
+
+    def __init__(self, max_keys=5000, variants=3):
+        self.max_keys = max_keys
+        self.variants = variants
+        self._entries = OrderedDict()  # key -> list[str]
+        self._lock = threading.Lock()
+        self._rng = random.Random()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return a cached message once the key has all its variants, else None."""
+        with self._lock:
+            variants = self._entries.get(key)
+            if variants is None or len(variants) < self.variants:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._rng.choice(variants)
+
+    def add(self, key, message):
+        with self._lock:
+            variants = self._entries.setdefault(key, [])
+            self._entries.move_to_end(key)
+            if len(variants) < self.variants:
+                variants.append(message)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,235 @@
+# llm.py
+"""Shared LLM access used by every AI endpoint.
+
+The backend named by LLM_PROVIDER (see providers.py) is created lazily and
+reused for the lifetime of the worker. A semaphore caps the number of
+in-flight completions so a burst of quiz requests cannot exhaust sockets
+or starve the event loop.
+
+Rate limits (429), server errors (5xx) and connection failures are retried
+with exponential backoff and full jitter, honouring ``Retry-After`` when the
+provider sends it. The concurrency slot is released while waiting.
+
+Before each call the worker-wide request and token budget is checked (see
+ratelimit.py); calls over budget queue briefly or fail with ProviderBusy
+rather than being throttled by the provider. Token usage from every
+response is recorded per endpoint in usage.py. Time spent waiting for
+budget or a slot and time spent in the provider are recorded as the
+``llm_queue`` and ``llm_call`` stages in metrics.py.
+
+Environment:
+    GROQ_API_KEY             API key for the groq provider
+    LLM_MODEL                model name (default: llama-3.3-70b-versatile)
+    LLM_MAX_CONCURRENCY      max simultaneous completions per worker (default: 256)
+    LLM_MAX_RETRIES          retries after a retryable failure (default: 3)
+    LLM_BACKOFF_BASE         first backoff ceiling in seconds (default: 0.5)
+    LLM_BACKOFF_MAX          largest backoff ceiling in seconds (default: 8)
+    LLM_REQUESTS_PER_MINUTE  global request budget per worker, 0 disables (default: 1000)
+    LLM_TOKENS_PER_MINUTE    global token budget per worker, 0 disables (default: 300000)
+    LLM_QUEUE_MAX_WAIT       longest wait for budget before ProviderBusy (default: 10)
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+
+from providers import ProviderError, RateLimited, create_provider  # noqa: F401  (errors are re-exported)
+from ratelimit import ProviderBusy, ProviderLimiter  # noqa: F401  (ProviderBusy is re-exported)
+from metrics import STAGE_SECONDS, Counter, stage_timer
+from usage import meter
+
+logger = logging.getLogger(__name__)
+
+LLM_CALLS = Counter("llm_calls_total", "LLM provider calls by outcome (ok, retry, error).", ["outcome"])
+
+DEFAULT_MODEL = "llama-3.3-70b-versatile"
+
+_provider = None
+_semaphore = None
+_limiter = None
+_in_flight = 0
+_waiting = 0
+_jitter = random.Random()  # private instance; never affected by random.seed()
+
+
+def max_concurrency():
+    return max(1, int(os.getenv("LLM_MAX_CONCURRENCY", "256")))
+
+
+def get_provider():
+    """Return the process-wide provider, creating it on first use."""
+    global _provider
+    if _provider is None:
+        _provider = create_provider(max_connections=max_concurrency())
+    return _provider
+
+
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(max_concurrency())
+    return _semaphore
+
+
+async def _acquire_slot():
+    """Wait for global budget, then for a concurrency slot."""
+    global _in_flight, _waiting
+    _waiting += 1
+    try:
+        with stage_timer("llm_queue"):
+            await get_limiter().acquire()
+            await _get_semaphore().acquire()
+    finally:
+        _waiting -= 1
+    _in_flight += 1
+
+
+def _release_slot():
+    global _in_flight
+    _in_flight -= 1
+    _get_semaphore().release()
+
+
+def queue_status():
+    """Snapshot of provider and queue state for /health and /metrics."""
+    provider = get_provider()
+    limiter = get_limiter()
+    return {
+        "provider": provider.name,
+        "configured": provider.configured,
+        "max_concurrency": max_concurrency(),
+        "in_flight": _in_flight,
+        "waiting": _waiting,
+        "waiting_for_budget": limiter.waiting,
+        "rejected_for_budget": limiter.rejected,
+    }
+
+
+def get_limiter():
+    """Return the worker-wide ProviderLimiter, creating it on first use."""
+    global _limiter
+    if _limiter is None:
+        _limiter = ProviderLimiter(
+            requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", "1000")),
+            tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "300000")),
+            max_wait=float(os.getenv("LLM_QUEUE_MAX_WAIT", "10")),
+        )
+    return _limiter
+
+
+def record_usage(model, usage):
+    """Count a response's token usage against its endpoint and the global budget."""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    meter.record(model, prompt_tokens, completion_tokens)
+    get_limiter().record_tokens(prompt_tokens + completion_tokens)
+
+
+def is_retryable(exc):
+    """True for rate limits, provider 5xx errors and connection failures."""
+    if not isinstance(exc, ProviderError):
+        return False
+    return exc.status_code is None or exc.status_code == 429 or exc.status_code >= 500
+
+
+def backoff_delay(attempt, exc=None):
+    """Full-jitter exponential backoff, never shorter than Retry-After."""
+    base = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+    cap = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+    delay = _jitter.uniform(0, min(cap, base * (2 ** attempt)))
+    retry_after = getattr(exc, "retry_after", None)
+    if retry_after:
+        delay = max(delay, min(cap, retry_after))
+    return delay
+
+
+async def _with_retries(call):
+    max_retries = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    attempt = 0
+    while True:
+        await _acquire_slot()
+        try:
+            with stage_timer("llm_call"):
+                result = await call()
+            LLM_CALLS.inc(outcome="ok")
+            return result
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                LLM_CALLS.inc(outcome="error")
+                raise
+            error = e
+        finally:
+            _release_slot()
+        LLM_CALLS.inc(outcome="retry")
+        delay = backoff_delay(attempt, error)
+        logger.warning("LLM call failed, retrying", extra={"error": type(error).__name__, "delay_s": round(delay, 2)})
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def chat_completion(messages, **params):
+    """Run a chat completion without blocking the event loop.
+
+    Waits for a free concurrency slot first, so excess requests queue here
+    instead of piling up open connections to the provider.
+    """
+    params.setdefault("model", os.getenv("LLM_MODEL", DEFAULT_MODEL))
+    response = await _with_retries(lambda: get_provider().complete(messages, **params))
+    record_usage(params["model"], getattr(response, "usage", None))
+    return response
+
+
+async def stream_chat_completion(messages, **params):
+    """Yield text deltas from a streaming chat completion as they arrive.
+
+    Only opening the stream is retried; once tokens have been sent to the
+    caller a failure is raised as-is. The concurrency slot is held until
+    the stream is exhausted or closed.
+    """
+    params.setdefault("model", os.getenv("LLM_MODEL", DEFAULT_MODEL))
+    max_retries = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    attempt = 0
+    while True:
+        await _acquire_slot()
+        started = time.perf_counter()
+        try:
+            stream = await get_provider().open_stream(messages, **params)
+            break
+        except Exception as e:
+            _release_slot()
+            if attempt >= max_retries or not is_retryable(e):
+                LLM_CALLS.inc(outcome="error")
+                raise
+            LLM_CALLS.inc(outcome="retry")
+            delay = backoff_delay(attempt, e)
+            logger.warning("LLM stream failed to open, retrying", extra={"error": type(e).__name__, "delay_s": round(delay, 2)})
+            await asyncio.sleep(delay)
+            attempt += 1
+    outcome = "error"
+    try:
+        async for chunk in stream:
+            # Groq reports usage on the final chunk under x_groq
+            usage = getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None)
+            if usage is not None:
+                record_usage(params["model"], usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+        outcome = "ok"
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="llm_call")
+        LLM_CALLS.inc(outcome=outcome)
+        _release_slot()
+
+
+async def aclose():
+    """Close the provider's connections; called on application shutdown."""
+    global _provider
+    if _provider is not None:
+        await _provider.aclose()
+        _provider = None
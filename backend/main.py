@@ -1,58 +1,120 @@
 # main.py
-from fastapi import FastAPI, HTTPException, Body
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from sqlalchemy import create_engine, Column, Integer, String
-from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
+
+# ------------------ Load .env ------------------
+# Loaded before the local modules below, which read their settings on import
+load_dotenv()
+
+# ------------------ Logging ------------------
+# Leveled logging written by a background thread (see logs.py), installed
+# when the app starts rather than on import
+import logging
+from logs import setup_logging
+logger = logging.getLogger(__name__)
+
+from fastapi import FastAPI, HTTPException, Body, Depends, Header, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import func, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from typing import List, Dict, Optional
 import os
 import json
-import random
 import hashlib
-from groq import Groq
+import secrets
+import re
+import asyncio
+import time
+from datetime import datetime
+from collections import Counter
+import auth
+import corpus
+import llm
+import metrics
+import passwords
+import prompts
+import scoreboard
+import usage
+from database import SessionLocal, database_status, engine, get_db, init_db, pool_status
+from models import User, Question, QuestionServed, Quiz, QuizQuestion
+from schemas import UserRegister, UserLogin, Topic, QuizSubmission, BulkQuizRequest
+from quiz_parser import QuestionStreamParser, normalize_question, parse_questions, validate_question
+from providers import ProviderError, RateLimited
+from question_cache import create_recent_questions_cache
+from similarity import QuestionSimilarityIndex, signature_text
+from variation import SeededQuizCache, VariationScheduler, new_seed, request_rng
+from skill import create_skill_model
+from coalesce import SingleFlight
+from feedback import FeedbackCache, percentage_bucket, template_feedback
+from tutor_history import HistoryCompactor, estimate_tokens
+from answer_cache import TutorAnswerCache, is_standalone
+from ratelimit import KeyedBuckets, ProviderBusy
+from metrics import stage_timer
 
-# ------------------ Load .env ------------------
-load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-groq_client = Groq(api_key=GROQ_API_KEY)
 
 # ------------------ Database Setup ------------------
-DATABASE_URL = "sqlite:///app.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(bind=engine)
-Base = declarative_base()
-
-class UserDB(Base):
-    __tablename__ = "users"
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String)
-    email = Column(String, unique=True)
-    password = Column(String)
-
-class QuestionDB(Base):
-    __tablename__ = "questions"
-    id = Column(Integer, primary_key=True, index=True)
-    question = Column(String)
-    answer = Column(String)
-
-# Create tables
-Base.metadata.create_all(bind=engine)
-
-# ------------------ Preload Default User ------------------
-db = SessionLocal()
-if db.query(UserDB).count() == 0:
-    default_user = UserDB(
-        name="Admin",
-        email="admin@test.com",
-        password="1234"
-    )
-    db.add(default_user)
-    db.commit()
-db.close()
+# Engine, sessions and models live in database.py / models.py. Tables are
+# created on startup (see lifespan below), not on import.
+def seed_default_user():
+    """Create the default admin account on an empty database."""
+    db = SessionLocal()
+    try:
+        if db.query(User).count() == 0:
+            default_user = User(
+                name="Admin",
+                email="admin@test.com",
+                password=passwords.hash_password("1234")
+            )
+            db.add(default_user)
+            db.commit()
+    finally:
+        db.close()
+
+def rebuild_score_aggregates():
+    """Fill the progress and leaderboard tables for scores recorded before they existed."""
+    db = SessionLocal()
+    try:
+        if scoreboard.needs_rebuild(db):
+            count = scoreboard.rebuild(db, normalize_topic)
+            logger.info("score aggregates rebuilt", extra={"scores": count})
+    finally:
+        db.close()
+
+def setup_storage():
+    init_db()
+    recent_questions_cache.setup()
+    seed_default_user()
+    rebuild_score_aggregates()
+    corpus.backfill_hashes(SessionLocal)
 
 # ------------------ FastAPI Setup ------------------
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup and shutdown. Importing main has no side effects; this does the work."""
+    setup_logging()
+    await run_in_threadpool(setup_storage)
+    app.state.bank_refill_task = asyncio.create_task(bank_refill_loop())
+    app.state.skill_checkpoint_task = asyncio.create_task(skill_checkpoint_loop())
+    try:
+        yield
+    finally:
+        for task in (app.state.bank_refill_task, app.state.skill_checkpoint_task):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await run_in_threadpool(skills.checkpoint)
+        await llm.aclose()
+        passwords.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(metrics.RequestMetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -61,26 +123,53 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ------------------ Pydantic Models ------------------
-class UserRegister(BaseModel):
-    name: str
-    email: str
-    password: str
-
-class UserLogin(BaseModel):
-    email: str
-    password: str
-
-class Topic(BaseModel):
-    topic: str
-    num_questions: Optional[int] = 5
-    timestamp: Optional[int] = None
-    seed: Optional[int] = None
-    attempt: Optional[int] = 1
-    difficulty: Optional[str] = None
-    variation_prompt: Optional[str] = None
-    request_id: Optional[str] = None
-    force_new: Optional[bool] = False
+# ------------------ Helpers ------------------
+def sse_event(payload: dict, event: Optional[str] = None) -> str:
+    """Format one Server-Sent Events frame with a JSON payload."""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(payload)}\n\n"
+
+# ------------------ Rate Limiting ------------------
+# Per-user token buckets in front of the AI endpoints. The global provider
+# budget (requests and tokens per minute) is enforced inside llm.py.
+RATE_LIMIT_USER_PER_MINUTE = float(os.getenv("RATE_LIMIT_USER_PER_MINUTE", "20"))
+user_buckets = KeyedBuckets(
+    rate=RATE_LIMIT_USER_PER_MINUTE / 60,
+    capacity=int(os.getenv("RATE_LIMIT_USER_BURST", "10"))
+)
+
+def rate_limit_key(endpoint: str, request: Request, user_id: Optional[int]) -> tuple:
+    """Bucket key: the user, or the client address for anonymous callers (AUTH_REQUIRED=0)."""
+    return (endpoint, user_id if user_id is not None else (request.client.host if request.client else "anonymous"))
+
+def too_many_requests(wait: float) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="You're sending requests too quickly. Please wait a moment and try again.",
+        headers={"Retry-After": str(int(wait) + 1)}
+    )
+
+def rate_limited(endpoint: str, take: bool = True):
+    """
+    Dependency for an AI endpoint: authenticates the caller, applies their
+    per-endpoint bucket and labels LLM usage with ``endpoint``.
+    With ``take=False`` the endpoint charges the bucket itself.
+    """
+    async def dependency(request: Request, user_id: Optional[int] = Depends(auth.get_current_user)):
+        usage.set_endpoint(endpoint)
+        wait = user_buckets.take(rate_limit_key(endpoint, request, user_id)) if take else 0
+        if wait:
+            raise too_many_requests(wait)
+        return user_id
+    return dependency
+
+@app.exception_handler(ProviderBusy)
+async def provider_busy_handler(request: Request, exc: ProviderBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "The AI service is busy right now. Please try again in a moment."},
+        headers={"Retry-After": str(int(exc.retry_after) + 1)}
+    )
 
 # ------------------ Root Route ------------------
 @app.get("/")
@@ -88,12 +177,31 @@ def root():
     return {"message": "AI Quiz & Tutor API is running", "status": "healthy"}
 
 # ------------------ User Routes ------------------
+def find_user_by_email(db: Session, email: str):
+    return db.query(User).filter(User.email == email.strip().lower()).first()
+
+def create_user(db: Session, name: str, email: str, password_hash: str):
+    db_user = User(name=name.strip(), email=email.strip().lower(), password=password_hash)
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+def update_password_hash(db: Session, db_user: User, password_hash: str):
+    db_user.password = password_hash
+    db.commit()
+
+def session_token(user_id: int) -> dict:
+    token, expires_at = auth.issue_token(user_id)
+    return {"token": token, "expires_at": expires_at}
+
+# Password hashing runs in passwords.py's own bounded pool and database work
+# in the threadpool, so a burst of logins never blocks the event loop
 @app.post("/register")
-def register(user: UserRegister):
-    db = SessionLocal()
+async def register(user: UserRegister, db: Session = Depends(get_db)):
     try:
         # Check if user already exists
-        existing = db.query(UserDB).filter(UserDB.email == user.email.strip().lower()).first()
+        existing = await run_in_threadpool(find_user_by_email, db, user.email)
         if existing:
             raise HTTPException(status_code=400, detail="Email already registered. Please sign in instead.")
         
@@ -102,16 +210,10 @@ def register(user: UserRegister):
             raise HTTPException(status_code=400, detail="Password must be at least 6 characters")
         
         # Create new user
-        db_user = UserDB(
-            name=user.name.strip(), 
-            email=user.email.strip().lower(), 
-            password=user.password
-        )
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        password_hash = await passwords.hash_password_async(user.password.strip())
+        db_user = await run_in_threadpool(create_user, db, user.name, user.email, password_hash)
         
-        print(f"✅ New user registered: {db_user.email}")
+        logger.info("user registered", extra={"user_id": db_user.id})
         
         # Return success response with user data (matching frontend expectations)
         return {
@@ -122,30 +224,43 @@ def register(user: UserRegister):
                 "email": db_user.email,
                 "username": db_user.name  # For compatibility
             },
-            "token": f"user_{db_user.id}_token"  # Simple token (not secure, but works for your project)
+            **session_token(db_user.id)
         }
         
     except HTTPException:
         raise  # Re-raise HTTPException as-is
+    except IntegrityError:
+        # Lost a race with a concurrent registration for the same email
+        await run_in_threadpool(db.rollback)
+        raise HTTPException(status_code=400, detail="Email already registered. Please sign in instead.")
     except Exception as e:
-        db.rollback()
-        print(f"❌ Registration error: {str(e)}")
+        await run_in_threadpool(db.rollback)
+        logger.exception("registration failed")
         raise HTTPException(status_code=500, detail=f"Registration failed: {str(e)}")
-    finally:
-        db.close()
 
 @app.post("/login")
-def login(user: UserLogin):
-    db = SessionLocal()
+async def login(user: UserLogin, db: Session = Depends(get_db)):
     try:
-        db_user = db.query(UserDB).filter(
-            UserDB.email == user.email.strip().lower()
-        ).first()
+        db_user = await run_in_threadpool(find_user_by_email, db, user.email)
+        if not db_user:
+            raise HTTPException(status_code=401, detail="Invalid email or password")
         
-        if not db_user or db_user.password != user.password.strip():
+        password = user.password.strip()
+        valid, needs_rehash = await passwords.verify_password_async(password, db_user.password)
+        if not valid:
             raise HTTPException(status_code=401, detail="Invalid email or password")
         
-        print(f"✅ User logged in: {db_user.email}")
+        if needs_rehash:
+            # Legacy plaintext password or an older, cheaper scrypt cost
+            try:
+                password_hash = await passwords.hash_password_async(password)
+                await run_in_threadpool(update_password_hash, db, db_user, password_hash)
+                logger.info("password hash upgraded", extra={"user_id": db_user.id})
+            except Exception as e:
+                await run_in_threadpool(db.rollback)
+                logger.warning("password rehash failed", extra={"user_id": db_user.id, "error": str(e)})
+        
+        logger.info("user logged in", extra={"user_id": db_user.id})
         
         return {
             "message": "Login successful", 
@@ -155,438 +270,1397 @@ def login(user: UserLogin):
                 "email": db_user.email,
                 "username": db_user.name
             },
-            "token": f"user_{db_user.id}_token"
+            **session_token(db_user.id)
         }
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"❌ Login error: {str(e)}")
+    except Exception:
+        logger.exception("login failed")
         raise HTTPException(status_code=500, detail="Login failed")
-    finally:
-        db.close()
+
+@app.post("/logout")
+async def logout(authorization: Optional[str] = Header(None)):
+    """Revoke the caller's token. Safe to call with an expired or missing token."""
+    auth.verifier.revoke(auth.bearer_token(authorization))
+    return {"message": "Logged out"}
 
 # ------------------ AI Quiz Generation (MAXIMUM VARIATION) ------------------
 
-# Global cache to store recent questions (in production, use Redis/database)
-recent_questions_cache = {}
+# Recent questions per topic, used to avoid repetition. Bounded, and shared
+# across workers when QUESTION_CACHE_BACKEND=sqlite (see question_cache.py)
+recent_questions_cache = create_recent_questions_cache(engine)
 
-@app.post("/ai-questions")
-def ai_questions(data: Topic):
-    MAX_RETRIES = 3
+# Near-duplicate detection for generated questions (see similarity.py)
+question_index = QuestionSimilarityIndex(
+    threshold=float(os.getenv("QUESTION_SIMILARITY_THRESHOLD", "0.5"))
+)
+AVOIDANCE_PROMPT_SIZE = int(os.getenv("QUIZ_AVOIDANCE_PROMPT_SIZE", "3"))
+
+# Style, difficulty and focus areas cycle per user (see variation.py); a
+# seeded request always gets the same variation and, once generated, the
+# same questions
+variation_scheduler = VariationScheduler(prompts.QUESTION_TYPES, prompts.DIFFICULTY_LEVELS, prompts.FOCUS_AREAS)
+seeded_quizzes = SeededQuizCache(max_entries=int(os.getenv("QUIZ_SEED_CACHE_SIZE", "5000")))
+
+# Per-user, per-topic Elo ratings that pick difficulty and focus (skill.py)
+skills = create_skill_model(SessionLocal, prompts.DIFFICULTY_LEVELS, prompts.FOCUS_AREAS)
+SKILL_CHECKPOINT_INTERVAL = int(os.getenv("SKILL_CHECKPOINT_INTERVAL", "30"))
+
+async def skill_checkpoint_loop():
+    """Periodically write changed skill ratings to the database."""
+    while True:
+        await asyncio.sleep(SKILL_CHECKPOINT_INTERVAL)
+        try:
+            await run_in_threadpool(skills.checkpoint)
+        except Exception:
+            logger.exception("skill checkpoint failed")
+
+async def load_skill(data: Topic):
+    """Make the caller's rating for the topic available to plan_quiz_generation."""
+    if data.user_id is not None:
+        await run_in_threadpool(skills.ensure_loaded, data.user_id, normalize_topic(data.topic))
+
+def plan_quiz_generation(data: Topic, adaptive: bool = False) -> dict:
+    """
+    Choose style, difficulty, focus areas and the avoidance list for one quiz request.
     
+    With ``adaptive``, a logged-in user's difficulty and focus areas come from
+    their skill on the topic (call load_skill first); seeded requests keep
+    their reproducible variation.
+    """
     # ✅ EXTRACT ALL PARAMETERS
     topic = data.topic.strip()
     num_questions = data.num_questions or 5
     attempt = data.attempt or 1
-    seed = data.seed or random.randint(1, 1000000)
-    
-    print(f"\n{'='*70}")
-    print(f"🎯 QUIZ GENERATION - ATTEMPT #{attempt}")
-    print(f"{'='*70}")
-    print(f"📚 Topic: {topic}")
-    print(f"🔢 Seed: {seed}")
-    print(f"🔄 Attempt: {attempt}")
-    print(f"{'='*70}\n")
-    
-    # ✅ MAXIMUM VARIATION STRATEGIES
-    random.seed(seed + attempt * 1000)  # Different seed each attempt
-    
-    # Question type variations (VERY DIFFERENT approaches)
-    question_types = [
-        {
-            "style": "Definition & Concept-Based",
-            "instruction": "Focus on 'What is...', 'Define...', 'Explain the concept of...' type questions",
-            "approach": "theoretical understanding and definitions"
-        },
-        {
-            "style": "Application & Problem-Solving",
-            "instruction": "Focus on 'How would you...', 'What happens when...', 'Solve this problem...' type questions",
-            "approach": "practical application and hands-on scenarios"
-        },
-        {
-            "style": "Comparison & Analysis",
-            "instruction": "Focus on 'Compare...', 'What is the difference...', 'Which is better...' type questions",
-            "approach": "comparing alternatives and analyzing trade-offs"
-        },
-        {
-            "style": "Real-World Scenarios",
-            "instruction": "Focus on 'In a real project...', 'A developer needs to...', scenario-based questions",
-            "approach": "real-world situations and case studies"
-        },
-        {
-            "style": "Debugging & Troubleshooting",
-            "instruction": "Focus on 'What's wrong with...', 'How to fix...', 'Why does this fail...' type questions",
-            "approach": "identifying and fixing errors"
-        },
-        {
-            "style": "Best Practices & Optimization",
-            "instruction": "Focus on 'What is the best way...', 'How to optimize...', 'Which approach is recommended...'",
-            "approach": "industry best practices and optimization techniques"
-        },
-        {
-            "style": "Advanced & Edge Cases",
-            "instruction": "Focus on advanced topics, edge cases, and uncommon scenarios in {topic}",
-            "approach": "challenging and advanced concepts"
-        },
-        {
-            "style": "Beginner-Friendly Fundamentals",
-            "instruction": "Focus on basic, foundational questions suitable for beginners learning {topic}",
-            "approach": "simple and fundamental concepts"
-        }
-    ]
-    
-    # Difficulty levels with specific instructions
-    difficulty_levels = [
-        {
-            "level": "Easy",
-            "instruction": "Make questions straightforward with clear correct answers. Suitable for beginners."
-        },
-        {
-            "level": "Medium",
-            "instruction": "Make questions moderately challenging, requiring good understanding of the topic."
-        },
-        {
-            "level": "Hard",
-            "instruction": "Make questions challenging and thought-provoking, requiring deep knowledge."
-        },
-        {
-            "level": "Mixed",
-            "instruction": "Include a mix of easy, medium, and hard questions."
-        }
-    ]
-    
-    # Content focus areas
-    focus_areas = [
-        "syntax and structure",
-        "common use cases",
-        "error handling",
-        "performance considerations",
-        "security aspects",
-        "design patterns",
-        "integration with other technologies",
-        "version differences and updates",
-        "common mistakes to avoid",
-        "industry standards"
-    ]
-    
-    # Select variation for this attempt (deterministic but different each time)
-    selected_type = question_types[attempt % len(question_types)]
-    selected_difficulty = difficulty_levels[attempt % len(difficulty_levels)]
-    selected_focuses = random.sample(focus_areas, k=min(3, len(focus_areas)))
+    seed = data.seed or new_seed()
+    
+    logger.debug("planning quiz", extra={"topic": topic, "attempt": attempt, "seed": seed})
+    bank_key = normalize_topic(topic)
+    
+    # ✅ MAXIMUM VARIATION STRATEGIES - derived from the seed when the client
+    # sends one, otherwise the next untried variation for this user on this
+    # topic; everyone starts a topic in step, so a class shares generations
+    if data.seed:
+        variation = variation_scheduler.seeded(seed, attempt)
+    else:
+        variation = variation_scheduler.next((data.user_id, bank_key), bank_key)
+    selected_type, selected_difficulty, selected_focuses = variation
+    
+    # ✅ ADAPTIVE DIFFICULTY - pitch the quiz at what this user can do on this topic
+    adaptive = adaptive and not data.seed and data.user_id is not None
+    if adaptive:
+        selected_difficulty, selected_focuses = skills.choose(data.user_id, bank_key, selected_focuses)
     
     # ✅ CHECK CACHE - Get previous questions to avoid repetition
     cache_key = topic.lower().replace(" ", "_")
-    previous_questions = recent_questions_cache.get(cache_key, [])
-    
-    # Keep only last 20 questions in cache
-    if len(previous_questions) > 20:
-        previous_questions = previous_questions[-20:]
-        recent_questions_cache[cache_key] = previous_questions
+    previous_questions = recent_questions_cache.get(cache_key)
     
     # Create avoidance instructions
     avoidance_text = ""
-    if previous_questions and len(previous_questions) > 0:
+    if previous_questions and AVOIDANCE_PROMPT_SIZE > 0:
         avoidance_text = f"\n\n❌ DO NOT REPEAT OR PARAPHRASE THESE PREVIOUS QUESTIONS:\n"
-        for idx, prev_q in enumerate(previous_questions[-10:], 1):  # Show last 10
+        # Only a few recent questions go into the prompt; near-duplicates are
+        # caught after generation by question_index instead
+        for idx, prev_q in enumerate(previous_questions[-AVOIDANCE_PROMPT_SIZE:], 1):
             avoidance_text += f"{idx}. {prev_q}\n"
         avoidance_text += "\n⚠️ YOUR QUESTIONS MUST BE COMPLETELY DIFFERENT FROM THE ABOVE LIST!\n"
     
+    return {
+        "topic": topic,
+        "num_questions": num_questions,
+        "attempt": attempt,
+        "seed": seed,
+        "selected_type": selected_type,
+        "selected_difficulty": selected_difficulty,
+        "selected_focuses": selected_focuses,
+        "cache_key": cache_key,
+        "bank_key": bank_key,
+        "seed_key": (bank_key, seed, attempt, num_questions) if data.seed else None,
+        "adaptive": adaptive,
+        "previous_questions": previous_questions,
+        "avoidance_text": avoidance_text,
+    }
+
+def build_quiz_messages(plan: dict) -> list:
+    """Fill the precompiled quiz prompt (see prompts.py) for a planned generation."""
+    return prompts.quiz_messages(
+        style=plan["selected_type"]["style"],
+        level=plan["selected_difficulty"]["level"],
+        topic=plan["topic"],
+        num_questions=plan["num_questions"],
+        attempt=plan["attempt"],
+        seed=plan["seed"],
+        focuses=plan["selected_focuses"],
+        avoidance_text=plan["avoidance_text"],
+    )
+
+def load_question_index(plan: dict):
+    """Index the topic's newest bank questions on first use in this worker. Blocking."""
+    key = plan["cache_key"]
+    if key in question_index:
+        return
+    db = SessionLocal()
+    try:
+        rows = db.query(Question.question, Question.options).filter(
+            Question.topic_key == plan["bank_key"]
+        ).order_by(Question.id.desc()).limit(question_index.per_topic).all()
+    finally:
+        db.close()
+    question_index.add(key, [signature_text(row.question, json.loads(row.options or "[]")) for row in reversed(rows)])
+
+def filter_near_duplicates(plan: dict, questions: list):
+    """Split questions into (unique, duplicates) against this topic's earlier questions."""
+    with stage_timer("validation"):
+        return question_index.filter_new(
+            plan["cache_key"], questions, key=lambda q: signature_text(q["question"], q["options"])
+        )
+
+def remember_questions(plan: dict, questions: list):
+    """Add generated question texts to the per-topic avoidance cache."""
+    new_question_texts = [q["question"] for q in questions]
+    recent_questions_cache.add(plan["cache_key"], new_question_texts)
+
+# ------------------ Question Bank ------------------
+# Generated questions are stored per (normalized topic, style, difficulty) and
+# served to users who have not seen them yet, so popular topics rarely need a
+# fresh LLM call. A background job keeps frequently requested keys stocked.
+BANK_LOW_WATERMARK = int(os.getenv("QUESTION_BANK_LOW_WATERMARK", "10"))
+BANK_REFILL_BATCH = int(os.getenv("QUESTION_BANK_REFILL_BATCH", "10"))
+BANK_MAX_SERVES = int(os.getenv("QUESTION_BANK_MAX_SERVES", "50"))
+BANK_REFILL_INTERVAL = int(os.getenv("QUESTION_BANK_REFILL_INTERVAL", "300"))
+BANK_HOT_TOPICS = int(os.getenv("QUESTION_BANK_HOT_TOPICS", "20"))
+
+bank_demand = Counter()      # (bank_key, style, level) -> recent request count
+bank_refill_plans = {}       # (bank_key, style, level) -> latest plan, used to refill
+bank_refills_running = {}    # (bank_key, style, level) -> asyncio.Task
+
+def normalize_topic(topic: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace: ' Python  Lists!' -> 'python lists'."""
+    return " ".join(re.sub(r"[^\w+#]+", " ", topic.lower()).split())
+
+def bank_key_for(plan: dict) -> tuple:
+    return (plan["bank_key"], plan["selected_type"]["style"], plan["selected_difficulty"]["level"])
+
+def bank_row_to_question(row: Question, number: int) -> dict:
+    return {
+        "id": number,
+        "question": row.question,
+        "options": json.loads(row.options),
+        "correct_answer": row.correct_answer,
+        "explanation": row.explanation or "",
+    }
+
+def bank_stock(key: tuple) -> int:
+    """Number of bank questions for a key that can still be served."""
+    bank_key, style, level = key
+    db = SessionLocal()
+    try:
+        return db.query(Question).filter(
+            Question.topic_key == bank_key,
+            Question.style == style,
+            Question.difficulty == level,
+            Question.serve_count < BANK_MAX_SERVES
+        ).count()
+    finally:
+        db.close()
+
+def take_from_bank(plan: dict, user_id: Optional[int], any_style: bool = False):
+    """
+    Take num_questions bank questions the user has not seen yet.
+    
+    With ``any_style`` only the topic and difficulty have to match.
+    Returns (questions, question_ids, remaining_stock); questions is None
+    when the bank cannot fill the whole request.
+    """
+    bank_key, style, level = bank_key_for(plan)
+    num_questions = plan["num_questions"]
+    db = SessionLocal()
+    try:
+        available = db.query(Question).filter(
+            Question.topic_key == bank_key,
+            Question.difficulty == level,
+            Question.serve_count < BANK_MAX_SERVES
+        )
+        if not any_style:
+            available = available.filter(Question.style == style)
+        stock = available.count()
+        if stock < num_questions:
+            return None, [], stock
+        
+        if user_id is not None:
+            seen = db.query(QuestionServed.id).filter(
+                QuestionServed.user_id == user_id,
+                QuestionServed.question_id == Question.id
+            )
+            available = available.filter(~seen.exists())
+        
+        rows = available.order_by(Question.serve_count, func.random()).limit(num_questions).all()
+        if len(rows) < num_questions:
+            return None, [], stock
+        
+        for row in rows:
+            row.serve_count += 1
+            if user_id is not None:
+                db.add(QuestionServed(user_id=user_id, question_id=row.id))
+        db.commit()
+        
+        retired = sum(1 for row in rows if row.serve_count >= BANK_MAX_SERVES)
+        questions = [bank_row_to_question(row, i) for i, row in enumerate(rows, 1)]
+        return questions, [row.id for row in rows], stock - retired
+    except Exception as e:
+        db.rollback()
+        logger.warning("question bank lookup failed", extra={"error": str(e)})
+        return None, [], 0
+    finally:
+        db.close()
+
+def store_in_bank(plan: dict, questions: list) -> list:
+    """Save generated questions to the bank and return their row ids."""
+    bank_key, style, level = bank_key_for(plan)
+    db = SessionLocal()
+    try:
+        rows = [
+            Question(
+                question=q["question"],
+                correct_answer=q["correct_answer"],
+                topic_key=bank_key,
+                style=style,
+                difficulty=level,
+                options=json.dumps(q["options"]),
+                explanation=q.get("explanation", ""),
+                serve_count=0,
+                content_hash=corpus.content_hash(bank_key, q["question"], q["options"], q["correct_answer"])
+            )
+            for q in questions
+        ]
+        db.add_all(rows)
+        db.commit()
+        return [row.id for row in rows]
+    except Exception as e:
+        db.rollback()
+        logger.warning("could not store questions in bank", extra={"error": str(e)})
+        return []
+    finally:
+        db.close()
+
+def mark_served(question_ids: list, user_id: Optional[int]):
+    """Count one serve of each bank question and remember that user_id has seen it."""
+    if not question_ids:
+        return
+    db = SessionLocal()
+    try:
+        db.query(Question).filter(Question.id.in_(question_ids)).update(
+            {Question.serve_count: Question.serve_count + 1},
+            synchronize_session=False
+        )
+        if user_id is not None:
+            # Ignore rows that already exist, e.g. a retransmitted request
+            db.execute(
+                sqlite_insert(QuestionServed)
+                .values([{"user_id": user_id, "question_id": qid} for qid in question_ids])
+                .on_conflict_do_nothing()
+            )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning("could not record served questions", extra={"error": str(e)})
+    finally:
+        db.close()
+
+async def serve_from_bank(plan: dict, data: Topic) -> Optional[tuple]:
+    """Return (questions, question_ids) from the bank, or None if the LLM must generate them."""
+    key = bank_key_for(plan)
+    bank_demand[key] += 1
+    bank_refill_plans[key] = plan
+    
+    if data.force_new:
+        return None
+    
+    questions, question_ids, remaining = await run_in_threadpool(take_from_bank, plan, data.user_id)
+    if not questions and plan["adaptive"]:
+        # The level is what matters for an adaptive quiz; any style will do
+        questions, question_ids, _ = await run_in_threadpool(take_from_bank, plan, data.user_id, True)
+    if not questions:
+        # The caller generates and banks questions now; refilling on top of
+        # that would pay for the same key twice
+        return None
+    # Only restock keys that were asked for before; one-off topics stay lazy
+    if remaining < BANK_LOW_WATERMARK and bank_demand[key] > 1 and not generation_running(key):
+        schedule_bank_refill(plan)
+    logger.info("served questions from bank", extra={"count": len(questions), "remaining": remaining})
+    return questions, question_ids
+
+def generation_running(key: tuple) -> bool:
+    """True while a request is generating questions for this bank key."""
+    return any(flight[1:4] == key for flight in quiz_flights.keys())
+
+def schedule_bank_refill(plan: dict):
+    key = bank_key_for(plan)
+    if key in bank_refills_running:
+        return
+    bank_refills_running[key] = asyncio.create_task(refill_bank(plan))
+
+async def restock_after_generation(plan: dict):
+    """Once a generation is banked, top up its key if it keeps being requested."""
+    key = bank_key_for(plan)
+    if bank_demand[key] > 1 and key not in bank_refills_running:
+        if await run_in_threadpool(bank_stock, key) < BANK_LOW_WATERMARK:
+            schedule_bank_refill(plan)
+
+async def refill_bank(plan: dict):
+    """Generate a batch of questions for a bank key in the background."""
+    usage.set_endpoint("bank-refill")  # runs in its own task, so this stays local to it
+    key = bank_key_for(plan)
+    refill_plan = dict(plan, num_questions=BANK_REFILL_BATCH, seed=new_seed())
+    try:
+        questions = await generate_questions(refill_plan)
+        await run_in_threadpool(store_in_bank, refill_plan, questions)
+        logger.info("question bank refilled", extra={"bank_key": key, "count": len(questions)})
+    except Exception as e:
+        logger.warning("question bank refill failed", extra={"bank_key": key, "error": str(e)})
+    finally:
+        bank_refills_running.pop(key, None)
+
+async def bank_refill_loop():
+    """Periodically top up the most requested bank keys, then decay demand counts."""
+    while True:
+        await asyncio.sleep(BANK_REFILL_INTERVAL)
+        try:
+            for key, _ in bank_demand.most_common(BANK_HOT_TOPICS):
+                stock = await run_in_threadpool(bank_stock, key)
+                if stock < BANK_LOW_WATERMARK and key in bank_refill_plans and not generation_running(key):
+                    schedule_bank_refill(bank_refill_plans[key])
+            
+            # Halve demand so topics that stop being requested drop out
+            for key in list(bank_demand):
+                bank_demand[key] //= 2
+                if bank_demand[key] == 0:
+                    del bank_demand[key]
+                    bank_refill_plans.pop(key, None)
+        except Exception:
+            logger.exception("question bank refill loop error")
+
+QUIZ_GENERATION_PARAMS = {
+    "temperature": 0.95,  # ✅ MAXIMUM creativity
+    "max_tokens": 3000,
+    "top_p": 0.95,  # ✅ More diverse outputs
+}
+
+def number_questions(questions: list) -> list:
+    """Give questions sequential ids starting at 1."""
+    for i, q in enumerate(questions, 1):
+        q["id"] = i
+    return questions
+
+async def generate_questions(plan: dict) -> list:
+    """
+    Call the LLM until it has produced num_questions valid, non-duplicate questions.
+    
+    Invalid and near-duplicate questions are dropped and only the missing
+    count is requested again, up to MAX_RETRIES calls in total. Rate limits
+    and provider errors are retried with backoff inside llm.chat_completion.
+    """
+    MAX_RETRIES = 3
+    
+    selected_type = plan["selected_type"]
+    selected_difficulty = plan["selected_difficulty"]
+    accepted = []
+    prompt_seed = plan["seed"]
+    await run_in_threadpool(load_question_index, plan)
+    
     for retry_attempt in range(MAX_RETRIES):
+        missing = plan["num_questions"] - len(accepted)
         try:
-            # ✅ SUPER DETAILED PROMPT WITH MAXIMUM VARIATION
-            prompt = f"""🎯 QUIZ GENERATION REQUEST #{attempt}
-
-**TOPIC:** {topic}
-
-**QUESTION TYPE FOR THIS QUIZ:** {selected_type['style']}
-{selected_type['instruction']}
-
-**DIFFICULTY LEVEL:** {selected_difficulty['level']}
-{selected_difficulty['instruction']}
-
-**CONTENT FOCUS:** Your questions should cover these aspects:
-{', '.join(selected_focuses)}
-
-**VARIATION REQUIREMENTS:**
-- This is quiz attempt #{attempt}
-- Use approach: {selected_type['approach']}
-- Random seed: {seed}
-- Make questions UNIQUE and CREATIVE
-- Avoid common/generic questions
-- Use diverse phrasing and examples
-{avoidance_text}
-
-**YOUR TASK:**
-Generate {num_questions} multiple-choice questions about {topic} that follow the "{selected_type['style']}" approach.
-
-**CRITICAL RULES:**
-1. Each question MUST be completely different from previous attempts
-2. Use the "{selected_type['style']}" question style
-3. Each question must have EXACTLY 4 options (A, B, C, D)
-4. Mark one correct_answer clearly
-5. Provide a helpful explanation for each question
-6. Make questions interesting and educational
-7. DO NOT use generic or commonly asked questions
-8. Be creative with examples and scenarios
-
-**OUTPUT FORMAT:**
-Return ONLY a valid JSON array (no markdown, no extra text):
-
-[
-  {{
-    "id": 1,
-    "question": "Your question text here?",
-    "options": ["Option A", "Option B", "Option C", "Option D"],
-    "correct_answer": "Option A",
-    "explanation": "Brief explanation of why this is correct"
-  }}
-]
-
-🚀 Begin generating {num_questions} UNIQUE {selected_type['style'].lower()} questions now!"""
-
-            print(f"📤 Sending request (Retry {retry_attempt + 1}/{MAX_RETRIES})...")
-            print(f"   Type: {selected_type['style']}")
-            print(f"   Difficulty: {selected_difficulty['level']}")
-            print(f"   Focus: {', '.join(selected_focuses)}")
-            print(f"   Previous questions to avoid: {len(previous_questions)}")
+            with stage_timer("prompt_build"):
+                messages = build_quiz_messages(dict(plan, num_questions=missing, seed=prompt_seed))
+
+            logger.debug("requesting quiz questions", extra={
+                "attempt": retry_attempt + 1,
+                "missing": missing,
+                "style": selected_type["style"],
+                "difficulty": selected_difficulty["level"],
+                "avoiding": len(plan["previous_questions"]),
+            })
             
-            response = groq_client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": f"You are a creative quiz generator. Generate UNIQUE questions that are different from previous attempts. Current attempt: #{attempt}. Style: {selected_type['style']}"
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.95,  # ✅ MAXIMUM creativity
-                max_tokens=3000,
-                top_p=0.95,  # ✅ More diverse outputs
+            response = await llm.chat_completion(
+                messages=messages,
+                **QUIZ_GENERATION_PARAMS
             )
             
             raw_text = response.choices[0].message.content.strip()
             
-            # Clean up response
-            if raw_text.startswith("```json"):
-                raw_text = raw_text[7:]
-            if raw_text.startswith("```"):
-                raw_text = raw_text[3:]
-            if raw_text.endswith("```"):
-                raw_text = raw_text[:-3]
-            raw_text = raw_text.strip()
-            
-            # Extract JSON array
-            start = raw_text.find("[")
-            end = raw_text.rfind("]") + 1
-            
-            if start == -1 or end == 0:
-                raise ValueError("No JSON array found in response")
-            
-            json_text = raw_text[start:end]
-            questions = json.loads(json_text)
-            
-            if not isinstance(questions, list) or len(questions) == 0:
-                raise ValueError("Invalid question format")
-            
-            # Validate questions
-            for q in questions:
-                if not all(key in q for key in ["question", "options", "correct_answer"]):
-                    raise ValueError("Missing required fields in question")
-                if len(q["options"]) != 4:
-                    raise ValueError("Each question must have exactly 4 options")
-            
-            # ✅ SAVE QUESTIONS TO CACHE (to avoid repetition)
-            new_question_texts = [q["question"] for q in questions]
-            recent_questions_cache[cache_key] = previous_questions + new_question_texts
-            
-            print(f"✅ Successfully generated {len(questions)} UNIQUE questions!")
-            print(f"   Style: {selected_type['style']}")
-            print(f"   Difficulty: {selected_difficulty['level']}")
-            print(f"   Total questions in cache: {len(recent_questions_cache[cache_key])}")
-            print(f"{'='*70}\n")
+            # ✅ KEEP EVERY VALID QUESTION - repairs minor JSON slips and drops
+            # only the malformed ones, so a retry asks for the shortfall alone
+            with stage_timer("json_parse"):
+                questions, rejected = parse_questions(raw_text)
+            if rejected:
+                logger.info("dropped invalid questions", extra={"count": rejected})
+            if not questions:
+                raise ValueError("No valid questions found in response")
             
-            # Preview first question
-            if questions:
-                print(f"📝 Sample question: {questions[0]['question'][:80]}...")
+            # ✅ REJECT NEAR-DUPLICATES of earlier questions on this topic
+            unique, duplicates = await run_in_threadpool(filter_near_duplicates, plan, questions[:missing])
+            accepted += unique
+            if duplicates:
+                logger.info("rejected near-duplicate questions", extra={"count": len(duplicates)})
+            if len(accepted) < plan["num_questions"]:
+                continue
             
-            return {
-                "questions": questions,
-                "topic": topic,
-                "attempt": attempt,
-                "style": selected_type['style'],
-                "difficulty": selected_difficulty['level'],
-                "message": f"Generated {len(questions)} unique questions using {selected_type['style']} approach"
-            }
+            logger.info("quiz questions generated", extra={
+                "topic": plan["topic"],
+                "count": len(accepted),
+                "llm_calls": retry_attempt + 1,
+                "style": selected_type["style"],
+                "difficulty": selected_difficulty["level"],
+            })
+            return number_questions(accepted)
             
-        except json.JSONDecodeError as e:
-            print(f"❌ Retry {retry_attempt + 1} - JSON parse error: {str(e)}")
+        except ValueError as e:
+            logger.warning("quiz response unusable", extra={"attempt": retry_attempt + 1, "error": str(e)})
             if retry_attempt < MAX_RETRIES - 1:
-                seed = random.randint(1, 1000000)
-        except Exception as e:
-            print(f"❌ Retry {retry_attempt + 1} - Error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+                # Drawn from the request's own RNG, so seeded retries stay reproducible
+                prompt_seed = request_rng(plan["seed"], plan["attempt"], retry_attempt).randint(1, 1000000)
+        except ProviderError as e:
+            # llm.chat_completion already backed off and retried transient
+            # failures; another immediate attempt here would only add load
+            logger.error("provider error after retries", extra={"error": str(e)})
+            if accepted:
+                break
+            if isinstance(e, RateLimited):
+                raise HTTPException(
+                    status_code=429,
+                    detail="The AI service is busy right now. Please try again in a moment."
+                )
+            break
+        except ProviderBusy:
+            # Over the worker's LLM budget; shed instead of queueing longer
+            if accepted:
+                break
+            raise
+        except Exception:
+            logger.exception("quiz generation attempt failed", extra={"attempt": retry_attempt + 1})
+    
+    if accepted:
+        logger.warning("returning partial quiz", extra={"count": len(accepted), "requested": plan["num_questions"]})
+        return number_questions(accepted)
     
-    print("❌ All retry attempts failed")
+    logger.error("quiz generation failed", extra={"topic": plan["topic"]})
     raise HTTPException(
         status_code=500,
         detail="Failed to generate questions after multiple attempts. Please try again."
     )
 
+# ✅ REQUEST COALESCING - identical concurrent quiz requests share one generation
+quiz_flights = SingleFlight()
+
+def coalesce_key(plan: dict, data: Topic, mode: str):
+    """
+    Key under which identical concurrent quiz requests share one generation.
+    
+    Requests match on (topic, count, style, difficulty). A force_new request
+    never joins someone else's generation; it only shares with retransmits
+    carrying the same request_id, and is not coalesced at all without one.
+    """
+    if data.force_new:
+        return (mode, "request_id", data.request_id) if data.request_id else None
+    return (mode, *bank_key_for(plan), plan["num_questions"])
+
+async def generate_and_store(plan: dict):
+    """Generate questions once, bank them and update the avoidance cache."""
+    questions = await generate_questions(plan)
+    question_ids = await run_in_threadpool(store_in_bank, plan, questions)
+    remember_questions(plan, questions)
+    await restock_after_generation(plan)
+    return questions, question_ids
+
+@app.post("/ai-questions")
+async def ai_questions(data: Topic, user_id: Optional[int] = Depends(rate_limited("ai-questions")),
+                       db: Session = Depends(get_db)):
+    # Trust the signed token, not the user_id claimed in the body
+    data.user_id = user_id
+    await load_skill(data)
+    plan = plan_quiz_generation(data, adaptive=True)
+    selected_type = plan["selected_type"]
+    selected_difficulty = plan["selected_difficulty"]
+    
+    # ✅ SEEDED REPLAY - the same seed returns exactly the same quiz
+    quiz = seeded_quizzes.get(plan["seed_key"]) if plan["seed_key"] and not data.force_new else None
+    source = "seed"
+    
+    # ✅ POOL FIRST - serve unseen questions from the bank when it has enough
+    if quiz is None:
+        quiz = await serve_from_bank(plan, data)
+        source = "bank"
+    if quiz is None:
+        quiz, shared = await quiz_flights.do(
+            coalesce_key(plan, data, "json"),
+            lambda: generate_and_store(plan)
+        )
+        await run_in_threadpool(mark_served, quiz[1], data.user_id)
+        source = "llm"
+        if shared:
+            logger.info("joined in-flight generation", extra={"topic": plan["topic"]})
+    elif source == "bank":
+        # ✅ SAVE QUESTIONS TO CACHE (to avoid repetition)
+        remember_questions(plan, quiz[0])
+    if plan["seed_key"]:
+        seeded_quizzes.add(plan["seed_key"], quiz)
+    
+    questions, question_ids = quiz
+    session_id = await run_in_threadpool(create_quiz_session, db, plan, data.user_id, question_ids)
+    
+    return {
+        "session_id": session_id,
+        "questions": [public_question(q) for q in questions],
+        "topic": plan["topic"],
+        "attempt": plan["attempt"],
+        "style": selected_type['style'],
+        "difficulty": selected_difficulty['level'],
+        "source": source,
+        "message": f"Generated {len(questions)} unique questions using {selected_type['style']} approach"
+    }
+
+async def stream_generated_questions(plan: dict):
+    """
+    Stream questions from the LLM as they parse, for quiz_flights.stream().
+    
+    Yields ("question", q) for each accepted question, then ("stored", ids)
+    once the batch is in the bank. Raises ValueError if nothing usable arrived.
+    """
+    parser = QuestionStreamParser()
+    questions = []
+    parse_seconds = 0.0
+    await run_in_threadpool(load_question_index, plan)
+    with stage_timer("prompt_build"):
+        messages = build_quiz_messages(plan)
+    try:
+        async for delta in llm.stream_chat_completion(
+            messages=messages,
+            **QUIZ_GENERATION_PARAMS
+        ):
+            started = time.perf_counter()
+            completed = parser.feed(delta)
+            parse_seconds += time.perf_counter() - started
+            for q in completed:
+                try:
+                    with stage_timer("validation"):
+                        validate_question(normalize_question(q))
+                except ValueError as e:
+                    logger.info("skipping invalid streamed question", extra={"error": str(e)})
+                    continue
+                unique, _ = filter_near_duplicates(plan, [q])
+                if not unique:
+                    logger.info("skipping near-duplicate streamed question")
+                    continue
+                q["id"] = len(questions) + 1
+                questions.append(q)
+                yield ("question", q)
+            # Text after the closing ] is ignored by the parser, but the stream
+            # is read to the end so llm.py sees the usage on the final chunk
+    except Exception as e:
+        logger.warning("quiz stream failed", extra={"error": str(e), "received": len(questions)})
+    metrics.STAGE_SECONDS.observe(parse_seconds, stage="json_parse")
+    
+    if not questions:
+        raise ValueError("No valid questions streamed")
+    
+    remember_questions(plan, questions)
+    question_ids = await run_in_threadpool(store_in_bank, plan, questions)
+    logger.info("quiz questions streamed", extra={
+        "topic": plan["topic"],
+        "count": len(questions),
+        "style": plan["selected_type"]["style"],
+        "difficulty": plan["selected_difficulty"]["level"],
+    })
+    yield ("stored", question_ids)
+    await restock_after_generation(plan)
+
+@app.post("/ai-questions/stream")
+async def ai_questions_stream(data: Topic, user_id: Optional[int] = Depends(rate_limited("ai-questions")),
+                              db: Session = Depends(get_db)):
+    """
+    Streaming variant of /ai-questions using Server-Sent Events.
+    
+    Events, in order:
+      meta      {"topic", "attempt", "style", "difficulty", "num_questions"}
+      question  {"index", "question"} - one per valid question, as soon as it parses
+      done      {"count", "source", "session_id"} - source is "seed", "bank" or "llm"
+      error     {"detail"} - generation failed or produced no valid questions
+    
+    Questions are sent without their answers; submit the session to grade it.
+    
+    Seeded replays and bank hits are emitted immediately. Objects that are malformed, fail
+    validation or near-duplicate earlier questions are skipped, not retried.
+    Identical concurrent requests subscribe to the same generation stream.
+    """
+    data.user_id = user_id
+    await load_skill(data)
+    plan = plan_quiz_generation(data, adaptive=True)
+    selected_type = plan["selected_type"]
+    selected_difficulty = plan["selected_difficulty"]
+    
+    async def event_stream():
+        yield sse_event({
+            "topic": plan["topic"],
+            "attempt": plan["attempt"],
+            "style": selected_type["style"],
+            "difficulty": selected_difficulty["level"],
+            "num_questions": plan["num_questions"],
+        }, event="meta")
+        
+        ready = seeded_quizzes.get(plan["seed_key"]) if plan["seed_key"] and not data.force_new else None
+        source = "seed"
+        if ready is None:
+            ready = await serve_from_bank(plan, data)
+            source = "bank"
+            if ready is not None:
+                remember_questions(plan, ready[0])
+                if plan["seed_key"]:
+                    seeded_quizzes.add(plan["seed_key"], ready)
+        if ready is not None:
+            questions, question_ids = ready
+            for index, q in enumerate(questions):
+                yield sse_event({"index": index, "question": public_question(q)}, event="question")
+            session_id = await run_in_threadpool(create_quiz_session, db, plan, data.user_id, question_ids)
+            yield sse_event({"count": len(questions), "source": source, "session_id": session_id}, event="done")
+            return
+        
+        items, shared = quiz_flights.stream(
+            coalesce_key(plan, data, "stream"),
+            lambda: stream_generated_questions(plan)
+        )
+        if shared:
+            logger.info("joined in-flight streamed generation", extra={"topic": plan["topic"]})
+        count = 0
+        streamed = []
+        session_id = None
+        try:
+            async for kind, value in items:
+                if kind == "question":
+                    yield sse_event({"index": count, "question": public_question(value)}, event="question")
+                    streamed.append(value)
+                    count += 1
+                elif kind == "stored":
+                    if plan["seed_key"]:
+                        seeded_quizzes.add(plan["seed_key"], (streamed, value))
+                    await run_in_threadpool(mark_served, value, data.user_id)
+                    session_id = await run_in_threadpool(create_quiz_session, db, plan, data.user_id, value)
+        except Exception as e:
+            logger.warning("quiz stream failed", extra={"error": str(e), "sent": count})
+        if session_id is None:
+            yield sse_event({"detail": "Failed to generate questions. Please try again."}, event="error")
+            return
+        
+        yield sse_event({"count": count, "source": "llm", "session_id": session_id}, event="done")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ------------------ Quiz Sessions ------------------
+# Every quiz handed out is saved as a session pointing at its bank questions.
+# Clients only see questions and options; answers are graded on submit.
+def public_question(q: dict) -> dict:
+    """A question as sent to the client, without its answer or explanation."""
+    return {"id": q["id"], "question": q["question"], "options": q["options"]}
+
+def create_quiz_sessions(db: Session, plan: dict, quizzes: list) -> list:
+    """
+    Save quizzes given as (user_id, question_ids) pairs in one transaction.
+    
+    Returns their session ids in the same order.
+    """
+    if not quizzes or not all(question_ids for _, question_ids in quizzes):
+        raise HTTPException(status_code=500, detail="Could not save the quiz. Please try again.")
+    try:
+        rows = [
+            Quiz(
+                session_id=secrets.token_urlsafe(16),
+                topic=plan["topic"],
+                user_id=user_id,
+                style=plan["selected_type"]["style"],
+                difficulty=plan["selected_difficulty"]["level"],
+                focuses=json.dumps(plan["selected_focuses"])
+            )
+            for user_id, _ in quizzes
+        ]
+        db.add_all(rows)
+        db.flush()
+        db.execute(insert(QuizQuestion), [
+            {"quiz_id": quiz.id, "position": position, "question_id": question_id}
+            for quiz, (_, question_ids) in zip(rows, quizzes)
+            for position, question_id in enumerate(question_ids)
+        ])
+        db.commit()
+        return [quiz.session_id for quiz in rows]
+    except Exception:
+        db.rollback()
+        raise
+
+def create_quiz_session(db: Session, plan: dict, user_id: Optional[int], question_ids: list) -> str:
+    """Save one quiz and its question order and return its session id."""
+    return create_quiz_sessions(db, plan, [(user_id, question_ids)])[0]
+
+def grade_quiz_session(db: Session, session_id: str, user_id: Optional[int], answers: list) -> dict:
+    """
+    Grade a submitted quiz and record the answers and the score.
+    
+    The session, its questions and their correct answers are read in one
+    query; the per-question results are written back in one bulk UPDATE.
+    A session can only be submitted once, by the user it was created for.
+    Questions the user was graded on in an earlier session are graded again
+    but do not count towards their score or skill rating, so replaying a
+    seeded quiz after seeing its answers earns nothing.
+    """
+    try:
+        rows = db.query(
+            Quiz.id.label("quiz_id"),
+            Quiz.user_id,
+            Quiz.topic,
+            Quiz.focuses,
+            Quiz.submitted_at,
+            QuizQuestion.id,
+            QuizQuestion.position,
+            QuizQuestion.question_id,
+            Question.correct_answer,
+            Question.explanation,
+            Question.difficulty
+        ).join(QuizQuestion, QuizQuestion.quiz_id == Quiz.id).join(
+            Question, Question.id == QuizQuestion.question_id
+        ).filter(Quiz.session_id == session_id).order_by(QuizQuestion.position).all()
+        
+        if not rows or (rows[0].user_id is not None and rows[0].user_id != user_id):
+            raise HTTPException(status_code=404, detail="Quiz session not found")
+        quiz_id = rows[0].quiz_id
+        
+        # Claim the session first so concurrent submits cannot both be graded
+        claimed = db.query(Quiz).filter(Quiz.id == quiz_id, Quiz.submitted_at.is_(None)).update(
+            {Quiz.submitted_at: datetime.utcnow()}, synchronize_session=False
+        )
+        if not claimed:
+            raise HTTPException(status_code=409, detail="This quiz has already been submitted")
+        
+        results = []
+        for row in rows:
+            chosen = answers[row.position] if row.position < len(answers) else None
+            results.append({
+                "id": row.position + 1,
+                "your_answer": chosen,
+                "correct_answer": row.correct_answer,
+                "is_correct": chosen is not None and chosen.strip() == (row.correct_answer or "").strip(),
+                "explanation": row.explanation or "",
+            })
+        score = sum(1 for r in results if r["is_correct"])
+        
+        # Answers already revealed to this user in an earlier graded session
+        seen = set()
+        if rows[0].user_id is not None:
+            seen = {question_id for (question_id,) in db.query(QuizQuestion.question_id).join(
+                Quiz, Quiz.id == QuizQuestion.quiz_id
+            ).filter(
+                QuizQuestion.question_id.in_([row.question_id for row in rows]),
+                Quiz.user_id == rows[0].user_id,
+                Quiz.submitted_at.isnot(None),
+                Quiz.id != quiz_id
+            )}
+        counted = [(row, r) for row, r in zip(rows, results) if row.question_id not in seen]
+        
+        db.execute(update(QuizQuestion), [
+            {"id": row.id, "chosen": r["your_answer"], "is_correct": r["is_correct"]}
+            for row, r in zip(rows, results)
+        ])
+        # Score history plus the progress and leaderboard aggregates (scoreboard.py)
+        topic = rows[0].topic
+        topic_key = normalize_topic(topic or "")
+        if counted:
+            scoreboard.record_score(
+                db, rows[0].user_id, topic, topic_key,
+                sum(1 for _, r in counted if r["is_correct"]), len(counted), quiz_id=quiz_id
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    
+    if rows[0].user_id is not None:
+        skills.record(
+            rows[0].user_id, topic_key,
+            [(row.difficulty, r["is_correct"]) for row, r in counted],
+            json.loads(rows[0].focuses or "[]")
+        )
+    
+    return {
+        "session_id": session_id,
+        "score": score,
+        "total": len(results),
+        "percentage": int(score / len(results) * 100),
+        "results": results,
+    }
+
+@app.post("/quiz-sessions/{session_id}/submit")
+async def submit_quiz(session_id: str, submission: QuizSubmission,
+                      user_id: Optional[int] = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+    """Grade all answers of a quiz session at once and store the score."""
+    with stage_timer("grading"):
+        return await run_in_threadpool(grade_quiz_session, db, session_id, user_id, submission.answers)
+
+# ------------------ Progress & Leaderboards ------------------
+# Both read the aggregate tables maintained on every submit (scoreboard.py),
+# never the full score history.
+@app.get("/progress")
+def progress(user_id: Optional[int] = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+    """The caller's per-topic averages and best scores, and their latest attempts."""
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Log in to see your progress")
+    return scoreboard.user_progress(db, user_id)
+
+@app.get("/leaderboard")
+def leaderboard(topic: str, limit: int = scoreboard.LEADERBOARD_SIZE,
+                user_id: Optional[int] = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+    """Best users of a topic by their best percentage."""
+    entries = scoreboard.topic_leaderboard(db, normalize_topic(topic), limit=max(1, min(limit, scoreboard.LEADERBOARD_SIZE)))
+    return {"topic": topic, "entries": entries}
+
+# ------------------ Bulk Quiz Generation ------------------
+# A teacher asks for many quizzes at once: (topic, count, difficulty) specs,
+# optionally for every student on a roster. Specs with the same topic and
+# difficulty share one question pool, generated in a few large LLM calls,
+# and every student gets their own shuffled selection from it. Pools are
+# generated concurrently under a bounded semaphore and each quiz is streamed
+# back as soon as its pool is ready.
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "50"))
+BULK_MAX_ROSTER = int(os.getenv("BULK_MAX_ROSTER", "200"))
+BULK_MAX_CONCURRENCY = int(os.getenv("BULK_MAX_CONCURRENCY", "8"))
+BULK_QUESTIONS_PER_CALL = int(os.getenv("BULK_QUESTIONS_PER_CALL", "15"))
+BULK_POOL_FACTOR = int(os.getenv("BULK_POOL_FACTOR", "3"))
+BULK_MAX_QUESTIONS = 20
+
+def find_difficulty(name: str) -> dict:
+    for level in prompts.DIFFICULTY_LEVELS:
+        if level["level"].lower() == name.strip().lower():
+            return level
+    names = ", ".join(level["level"] for level in prompts.DIFFICULTY_LEVELS)
+    raise HTTPException(status_code=400, detail=f"Unknown difficulty '{name}'. Use one of: {names}")
+
+def resolve_roster(emails: list) -> list:
+    """Map roster emails to (email, user_id) in one query; unknown students get None."""
+    normalized = [email.strip().lower() for email in emails]
+    db = SessionLocal()
+    try:
+        ids = dict(db.query(User.email, User.id).filter(User.email.in_(set(normalized))).all())
+    finally:
+        db.close()
+    return [(email, ids.get(email)) for email in normalized]
+
+def chunk_sizes(total: int, per_call: int) -> list:
+    """Split ``total`` questions into as few, as even LLM calls as possible: 32, 15 -> [11, 11, 10]."""
+    calls = max(1, -(-total // max(1, per_call)))
+    return [total // calls + (1 if i < total % calls else 0) for i in range(calls)]
+
+def bulk_pool_size(sizes: list, students: int) -> int:
+    """Questions generated for one pool: enough for everyone, capped by BULK_POOL_FACTOR."""
+    return min(sum(sizes) * students, max(sizes) * max(1, BULK_POOL_FACTOR))
+
+async def generate_question_pool(plan: dict, limit: asyncio.Semaphore):
+    """Generate plan["num_questions"] questions in concurrent chunks and bank them."""
+    async def chunk(index: int, size: int):
+        async with limit:
+            seed = request_rng(plan["seed"], "chunk", index).randint(1, 1000000)
+            return await generate_questions(dict(plan, num_questions=size, seed=seed))
+    
+    batches = await asyncio.gather(
+        *(chunk(i, size) for i, size in enumerate(chunk_sizes(plan["num_questions"], BULK_QUESTIONS_PER_CALL))),
+        return_exceptions=True
+    )
+    questions = [q for batch in batches if not isinstance(batch, BaseException) for q in batch]
+    if not questions:
+        raise next(batch for batch in batches if isinstance(batch, BaseException))
+    number_questions(questions)
+    question_ids = await run_in_threadpool(store_in_bank, plan, questions)
+    remember_questions(plan, questions)
+    return questions, question_ids
+
+@app.post("/ai-questions/bulk")
+async def ai_questions_bulk(data: BulkQuizRequest, request: Request,
+                            user_id: Optional[int] = Depends(rate_limited("ai-questions-bulk", take=False)),
+                            db: Session = Depends(get_db)):
+    """
+    Generate many quizzes at once and stream each one as Server-Sent Events.
+    
+    Body: {"items": [{"topic", "num_questions", "difficulty"}], "roster": [emails]}.
+    Without a roster every item is one quiz for the caller; with one, every
+    student gets every item, as a session they can submit themselves
+    (students who are not registered get sessions anyone can submit).
+    
+    The caller's rate-limit bucket is charged one token per planned LLM call.
+    
+    Events, in order:
+      meta    {"items", "students", "pools"}
+      result  {"item", "student", "topic", "difficulty", "style", "session_id", "questions"}
+      error   {"item", "detail"} - one per item whose pool could not be generated
+      done    {"count", "failed"}
+    """
+    if not data.items or len(data.items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {BULK_MAX_ITEMS} items.")
+    if data.roster is not None and not 0 < len(data.roster) <= BULK_MAX_ROSTER:
+        raise HTTPException(status_code=400, detail=f"A roster can have 1 to {BULK_MAX_ROSTER} students.")
+    
+    # ✅ PACK COMPATIBLE SPECS - one pool per (topic, difficulty)
+    groups = {}
+    for index, item in enumerate(data.items):
+        if not item.topic.strip():
+            raise HTTPException(status_code=400, detail=f"Item {index} has no topic.")
+        if not 1 <= (item.num_questions or 5) <= BULK_MAX_QUESTIONS:
+            raise HTTPException(status_code=400, detail=f"Item {index}: num_questions must be 1 to {BULK_MAX_QUESTIONS}.")
+        difficulty = find_difficulty(item.difficulty) if item.difficulty else None
+        key = (normalize_topic(item.topic), difficulty["level"] if difficulty else None)
+        groups.setdefault(key, (item.topic.strip(), difficulty, []))[2].append(index)
+    
+    students = await run_in_threadpool(resolve_roster, data.roster) if data.roster else [(None, user_id)]
+    
+    # ✅ CHARGE BY FAN-OUT - one rate-limit token per planned LLM call
+    planned_calls = sum(
+        len(chunk_sizes(bulk_pool_size([data.items[i].num_questions or 5 for i in indexes], len(students)),
+                        BULK_QUESTIONS_PER_CALL))
+        for _, _, indexes in groups.values()
+    )
+    wait = user_buckets.charge(rate_limit_key("ai-questions-bulk", request, user_id), planned_calls)
+    if wait:
+        raise too_many_requests(wait)
+    limit = asyncio.Semaphore(BULK_MAX_CONCURRENCY)
+    saving = asyncio.Lock()  # pools run concurrently but share the request's session
+    
+    async def run_pool(topic: str, difficulty: Optional[dict], indexes: list) -> list:
+        """Generate one pool and hand out its quizzes; returns the events to send."""
+        sizes = {i: data.items[i].num_questions or 5 for i in indexes}
+        plan = plan_quiz_generation(Topic(
+            topic=topic,
+            num_questions=bulk_pool_size(list(sizes.values()), len(students)),
+            user_id=user_id
+        ))
+        if difficulty:
+            plan["selected_difficulty"] = difficulty
+        try:
+            pool, pool_ids = await generate_question_pool(plan, limit)
+            
+            # Every (item, student) gets its own order and selection
+            assignments = []
+            for i in indexes:
+                for s, (email, student_id) in enumerate(students):
+                    picks = request_rng(plan["seed"], i, s).sample(range(len(pool)), min(sizes[i], len(pool)))
+                    assignments.append((i, email, student_id, picks))
+            async with saving:
+                session_ids = await run_in_threadpool(
+                    create_quiz_sessions, db, plan,
+                    [(student_id, [pool_ids[p] for p in picks]) for _, _, student_id, picks in assignments]
+                )
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else "Failed to generate questions. Please try again."
+            logger.warning("bulk quiz pool failed", extra={"topic": topic, "error": str(e)})
+            return [("error", {"item": i, "detail": detail}) for i in indexes]
+        
+        return [
+            ("result", {
+                "item": i,
+                "student": email,
+                "topic": plan["topic"],
+                "difficulty": plan["selected_difficulty"]["level"],
+                "style": plan["selected_type"]["style"],
+                "session_id": session_id,
+                "questions": [public_question(dict(pool[p], id=n)) for n, p in enumerate(picks, 1)],
+            })
+            for (i, email, _, picks), session_id in zip(assignments, session_ids)
+        ]
+    
+    async def event_stream():
+        yield sse_event({"items": len(data.items), "students": len(students), "pools": len(groups)}, event="meta")
+        tasks = [asyncio.create_task(run_pool(*group)) for group in groups.values()]
+        count = failed = 0
+        try:
+            for finished in asyncio.as_completed(tasks):
+                for kind, payload in await finished:
+                    if kind == "result":
+                        count += 1
+                    else:
+                        failed += 1
+                    yield sse_event(payload, event=kind)
+        finally:
+            for task in tasks:
+                task.cancel()
+        logger.info("bulk quizzes generated", extra={"quizzes": count, "failed_items": failed, "pools": len(groups)})
+        yield sse_event({"count": count, "failed": failed}, event="done")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ------------------ AI Tutor (Chat Interface) ------------------
+TUTOR_SYSTEM_PROMPT = prompts.TUTOR_SYSTEM_PROMPT
+
+def build_tutor_messages(question: str, conversation_history: list, summary: Optional[str] = None) -> list:
+    """Build the Groq message list: system prompt, summary, prior turns, current question."""
+    messages = [{"role": "system", "content": TUTOR_SYSTEM_PROMPT}]
+    
+    # Older turns, compacted by history_compactor
+    if summary:
+        messages.append({
+            "role": "system",
+            "content": f"Summary of the earlier conversation:\n{summary}"
+        })
+    
+    # Add conversation history (for context)
+    for msg in conversation_history:
+        if isinstance(msg, dict) and "role" in msg and "content" in msg:
+            messages.append({
+                "role": msg["role"],
+                "content": msg["content"]
+            })
+    
+    # Add current question
+    messages.append({"role": "user", "content": question})
+    return messages
+
+async def summarize_history(previous_summary: Optional[str], messages: list) -> str:
+    """Fold older chat turns into the running summary with a small, fast model."""
+    transcript = "\n".join(f"{m['role'].upper()}: {m['content']}" for m in messages)
+    prompt = prompts.HISTORY_SUMMARY_PROMPT.render(
+        previous_summary=previous_summary or "(none yet)",
+        transcript=transcript
+    )
+    response = await llm.chat_completion(
+        messages=[{"role": "user", "content": prompt}],
+        model=os.getenv("TUTOR_SUMMARY_MODEL", "llama-3.1-8b-instant"),
+        temperature=0.3,
+        max_tokens=300
+    )
+    return response.choices[0].message.content.strip()
+
+# ✅ HISTORY COMPACTION - recent turns verbatim, older ones as a cached summary
+history_compactor = HistoryCompactor(
+    summarize_history,
+    keep_messages=int(os.getenv("TUTOR_HISTORY_KEEP_MESSAGES", "8")),
+    max_input_tokens=int(os.getenv("TUTOR_MAX_INPUT_TOKENS", "6000"))
+)
+
+async def prepare_tutor_messages(question: str, request: dict, user_id: Optional[int]) -> list:
+    """Compact the client's history to the token budget and build the prompt."""
+    reserved = estimate_tokens(TUTOR_SYSTEM_PROMPT) + estimate_tokens(question) + 8
+    if reserved > history_compactor.max_input_tokens:
+        raise HTTPException(status_code=413, detail="Question is too long. Please shorten it.")
+    summary, recent = await history_compactor.compact(
+        request.get("conversation_history", []),
+        conversation_id=request.get("conversation_id"),
+        user_id=user_id,
+        reserved_tokens=reserved
+    )
+    return build_tutor_messages(question, recent, summary)
+
+# ✅ ANSWER CACHE - standalone questions ("what is recursion?") are answered
+# once and then served from memory, including rephrasings with the same content words
+tutor_answers = TutorAnswerCache(
+    max_entries=int(os.getenv("TUTOR_CACHE_MAX_ENTRIES", "5000")),
+    ttl=int(os.getenv("TUTOR_CACHE_TTL", "86400"))
+)
+TUTOR_CACHE_MAX_HISTORY = int(os.getenv("TUTOR_CACHE_MAX_HISTORY", "2"))
+
+def cacheable_tutor_question(question: str, request: dict) -> bool:
+    history = request.get("conversation_history") or []
+    return is_standalone(question, history, max_history=TUTOR_CACHE_MAX_HISTORY)
+
+def tutor_error_detail(error: Exception):
+    """Map a provider error to an (HTTP status, detail) pair."""
+    error_msg = str(error)
+    if isinstance(error, ProviderBusy):
+        return 503, "The AI service is busy right now. Please try again in a moment."
+    if isinstance(error, RateLimited):
+        return 429, "Rate limit exceeded. Please wait and try again."
+    if "authentication" in error_msg.lower() or "api_key" in error_msg.lower():
+        return 500, "Invalid Groq API key. Get one from https://console.groq.com/keys"
+    return 500, f"AI Tutor error: {error_msg}"
+
 @app.post("/ai-tutor")
-async def ai_tutor(request: dict):
+async def ai_tutor(request: dict, user_id: Optional[int] = Depends(rate_limited("ai-tutor"))):
     """
     AI Tutor endpoint - ChatGPT-like interface
     
     Request body:
     {
         "question": "User's question here",
-        "conversation_history": [...]
+        "conversation_history": [...],
+        "conversation_id": "optional id used to cache the history summary"
     }
+    
+    Only the last TUTOR_HISTORY_KEEP_MESSAGES messages are sent verbatim;
+    older ones are replaced by a rolling summary (see tutor_history.py).
     """
     try:
         # Extract data from request
         question = request.get("question", "")
         conversation_history = request.get("conversation_history", [])
-        print(f"\n=== AI TUTOR REQUEST ===")
-        print(f"Question: {question}")
-        print(f"Conversation history: {len(conversation_history)} messages")
+        logger.debug("tutor request", extra={"history_messages": len(conversation_history)})
         
         # Validate inputs
         if not question or question.strip() == "":
             raise HTTPException(status_code=400, detail="Question cannot be empty")
         
-        if not GROQ_API_KEY:
-            print("❌ ERROR: GROQ_API_KEY not found")
+        cacheable = cacheable_tutor_question(question, request)
+        if cacheable:
+            cached = tutor_answers.get(question)
+            if cached is not None:
+                logger.info("tutor answered from cache", extra={"answer_chars": len(cached)})
+                return {"answer": cached, "question": question, "cached": True}
+        
+        if not llm.get_provider().configured:
+            logger.error("GROQ_API_KEY not configured")
             raise HTTPException(
                 status_code=500, 
                 detail="GROQ_API_KEY not configured. Please set it in .env file."
             )
         
-        # Build messages for Groq
-        messages = [
-            {
-                "role": "system", 
-                "content": """You are an intelligent, friendly AI tutor. Your job is to:
-1. Explain concepts clearly and simply
-2. Provide examples when helpful
-3. Answer questions accurately
-4. Encourage learning
-5. Be conversational and supportive
-
-Keep responses concise but informative (2-4 paragraphs usually). Use simple language."""
-            }
-        ]
-        
-        # Add conversation history (for context)
-        for msg in conversation_history:
-            if isinstance(msg, dict) and "role" in msg and "content" in msg:
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-        
-        # Add current question
-        messages.append({"role": "user", "content": question})
+        messages = await prepare_tutor_messages(question, request, user_id)
         
-        print(f"📤 Sending {len(messages)} messages to Groq API...")
         
-        # Call Groq API
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
+        # Call the LLM provider
+        response = await llm.chat_completion(
             messages=messages,
             temperature=0.7,
             max_tokens=1000
         )
         
         answer = response.choices[0].message.content.strip()
+        if cacheable:
+            tutor_answers.add(question, answer)
         
-        print(f"✅ Got response ({len(answer)} characters)")
-        print(f"Preview: {answer[:100]}...")
+        logger.info("tutor answered", extra={"prompt_messages": len(messages), "answer_chars": len(answer)})
         
         return {
             "answer": answer,
-            "question": question
+            "question": question,
+            "cached": False
         }
         
     except HTTPException:
         raise
     except Exception as e:
         error_msg = str(e)
-        print(f"❌ ERROR in ai_tutor: {error_msg}")
-        
         # Handle specific errors
-        if "authentication" in error_msg.lower() or "api_key" in error_msg.lower():
-            raise HTTPException(
-                status_code=500, 
-                detail="Invalid Groq API key. Get one from https://console.groq.com/keys"
-            )
-        elif "rate_limit" in error_msg.lower():
-            raise HTTPException(
-                status_code=429, 
-                detail="Rate limit exceeded. Please wait and try again."
-            )
+        status_code, detail = tutor_error_detail(e)
+        if status_code == 500:
+            logger.exception("tutor request failed")
         else:
-            import traceback
-            traceback.print_exc()
-            raise HTTPException(
-                status_code=500, 
-                detail=f"AI Tutor error: {error_msg}"
-            )
+            logger.warning("tutor request failed", extra={"status": status_code, "error": error_msg})
+        headers = {"Retry-After": str(int(e.retry_after) + 1)} if isinstance(e, ProviderBusy) else None
+        raise HTTPException(status_code=status_code, detail=detail, headers=headers)
+
+@app.post("/ai-tutor/stream")
+async def ai_tutor_stream(request: dict, user_id: Optional[int] = Depends(rate_limited("ai-tutor"))):
+    """
+    Streaming variant of /ai-tutor using Server-Sent Events.
+    
+    Same request body as /ai-tutor. Emits one `data: {"delta": "..."}` event
+    per token chunk, then `event: done`. Provider failures after the stream
+    has started are reported as `event: error` with a `detail` field. A
+    cached answer is sent as a single delta.
+    """
+    question = request.get("question", "")
+    
+    if not question or question.strip() == "":
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+    
+    cacheable = cacheable_tutor_question(question, request)
+    cached = tutor_answers.get(question) if cacheable else None
+    if cached is not None:
+        async def cached_stream():
+            yield sse_event({"delta": cached})
+            yield sse_event({"question": question, "cached": True}, event="done")
+        return StreamingResponse(
+            cached_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    if not llm.get_provider().configured:
+        raise HTTPException(
+            status_code=500, 
+            detail="GROQ_API_KEY not configured. Please set it in .env file."
+        )
+    
+    messages = await prepare_tutor_messages(question, request, user_id)
+    
+    async def event_stream():
+        parts = []
+        try:
+            async for delta in llm.stream_chat_completion(
+                messages=messages,
+                temperature=0.7,
+                max_tokens=1000
+            ):
+                parts.append(delta)
+                yield sse_event({"delta": delta})
+            if cacheable:
+                tutor_answers.add(question, "".join(parts).strip())
+            yield sse_event({"question": question, "cached": False}, event="done")
+        except Exception as e:
+            logger.warning("tutor stream failed", extra={"error": str(e)})
+            _, detail = tutor_error_detail(e)
+            yield sse_event({"detail": detail}, event="error")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # ------------------ Quiz Feedback ------------------
+# Feedback depends only on (topic, score band), so LLM answers are cached per
+# (normalized topic, 10% bucket). FEEDBACK_MODE=template skips the LLM.
+FEEDBACK_MODE = os.getenv("FEEDBACK_MODE", "llm").lower()
+feedback_cache = FeedbackCache(
+    max_keys=int(os.getenv("FEEDBACK_CACHE_MAX_KEYS", "5000")),
+    variants=int(os.getenv("FEEDBACK_CACHE_VARIANTS", "3"))
+)
+
 @app.post("/quiz-feedback")
-def quiz_feedback(data: dict):
+async def quiz_feedback(data: dict, user_id: Optional[int] = Depends(rate_limited("quiz-feedback"))):
     """Generate encouraging feedback based on quiz score"""
+    score = data.get("score", 0)
+    total = data.get("total", 0)
+    topic = data.get("topic", "this topic")
+    percentage = int((score / total) * 100) if total > 0 else 0
+    
+    logger.debug("quiz feedback request", extra={"percentage": percentage})
+    
+    # ✅ FAST PATHS - templates on request, then cached LLM variants
+    if FEEDBACK_MODE == "template" or data.get("mode") == "template":
+        return {"feedback": template_feedback(topic, percentage)}
+    
+    cache_key = (normalize_topic(topic), percentage_bucket(percentage))
+    cached = feedback_cache.get(cache_key)
+    if cached:
+        return {"feedback": cached}
+    
     try:
-        score = data.get("score", 0)
-        total = data.get("total", 0)
-        topic = data.get("topic", "this topic")
-        percentage = int((score / total) * 100) if total > 0 else 0
-        
-        print(f"\n=== QUIZ FEEDBACK ===")
-        print(f"Score: {score}/{total} ({percentage}%)")
-        
-        prompt = f"""A student completed a quiz on {topic}.
-Score: {score}/{total} ({percentage}%)
-
-Provide brief, encouraging feedback (2-3 sentences) that:
-1. Acknowledges their performance
-2. Highlights what they did well
-3. Suggests improvement if score < 80%
-
-Be supportive and constructive."""
+        prompt = prompts.FEEDBACK_PROMPT.render(topic=topic, percentage=percentage_bucket(percentage))
 
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
+        response = await llm.chat_completion(
             messages=[{"role": "user", "content": prompt}],
             temperature=0.7,
             max_tokens=200
         )
         
         feedback = response.choices[0].message.content.strip()
-        print(f"✅ Generated feedback")
+        feedback_cache.add(cache_key, feedback)
         
         return {"feedback": feedback}
     except Exception as e:
-        print(f"❌ Feedback error: {str(e)}")
+        logger.warning("feedback generation failed, using template", extra={"error": str(e)})
         # Fallback feedback if AI fails
-        if score / total >= 0.8:
-            return {"feedback": "Excellent work! You have a strong understanding of this topic."}
-        elif score / total >= 0.6:
-            return {"feedback": "Good effort! Review the explanations and try again to improve."}
-        else:
-            return {"feedback": "Keep practicing! Review the material and take your time with each question."}
+        return {"feedback": template_feedback(topic, percentage)}
+
+# ------------------ Question Corpus ------------------
+# Gzipped JSONL dumps of the question bank (corpus.py), so a new deployment
+# can be warmed from an old one instead of regenerating every question.
+# Admin routes are off until ADMIN_EMAILS names at least one account
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+
+def is_admin(db: Session, user_id: int) -> bool:
+    user = db.get(User, user_id)
+    return user is not None and user.email in ADMIN_EMAILS
+
+async def require_admin(user_id: Optional[int] = Depends(auth.get_current_user), db: Session = Depends(get_db)) -> int:
+    """FastAPI dependency allowing only users listed in ADMIN_EMAILS."""
+    if user_id is None or not await run_in_threadpool(is_admin, db, user_id):
+        raise HTTPException(status_code=403, detail="Admins only")
+    return user_id
+
+@app.get("/admin/questions/export")
+def export_questions(include_retired: bool = False, user_id: int = Depends(require_admin)):
+    """Stream the question bank as gzipped JSONL; retired questions only if asked for."""
+    chunks = corpus.export_gzip(SessionLocal, max_serves=None if include_retired else BANK_MAX_SERVES)
+    return StreamingResponse(chunks, media_type="application/gzip", headers={
+        "Content-Disposition": 'attachment; filename="questions.jsonl.gz"'
+    })
+
+@app.post("/admin/questions/import")
+async def import_questions(request: Request, user_id: int = Depends(require_admin)):
+    """
+    Load a corpus from the request body (gzipped or plain JSONL) into the bank.
+    
+    The body is processed as it arrives; questions already in the bank are skipped.
+    """
+    importer = corpus.CorpusImporter(SessionLocal)
+    async for chunk in request.stream():
+        await run_in_threadpool(importer.feed, chunk)
+    stats = await run_in_threadpool(importer.close)
+    logger.info("question corpus imported", extra=stats)
+    return stats
+
+# ------------------ LLM Usage ------------------
+@app.get("/usage")
+def llm_usage():
+    """LLM calls and tokens per endpoint and model since this worker started."""
+    limiter = llm.get_limiter()
+    return {
+        "endpoints": usage.meter.snapshot(),
+        "provider_queue": {"waiting": limiter.waiting, "rejected": limiter.rejected}
+    }
+
+# ------------------ Metrics ------------------
+# Request counts and latencies come from RequestMetricsMiddleware and stage
+# timings from stage_timer(); these gauges are read at scrape time.
+def _llm_token_totals():
+    totals = {}
+    for endpoint, models in usage.meter.snapshot().items():
+        for model, entry in models.items():
+            totals[(endpoint, model, "prompt")] = entry["prompt_tokens"]
+            totals[(endpoint, model, "completion")] = entry["completion_tokens"]
+    return totals
+
+metrics.Gauge("llm_in_flight", "LLM calls currently running.", callback=lambda: llm.queue_status()["in_flight"])
+metrics.Gauge("llm_waiting", "LLM calls waiting for budget or a concurrency slot.", callback=lambda: llm.queue_status()["waiting"])
+metrics.Counter("llm_budget_rejections_total", "LLM calls refused because the global budget wait was too long.",
+                callback=lambda: llm.get_limiter().rejected)
+metrics.Counter("llm_tokens_total", "LLM tokens used, by endpoint, model and kind.", ["endpoint", "model", "kind"],
+                callback=_llm_token_totals)
+metrics.Gauge("db_pool_connections", "Database pool connections by state.", ["state"],
+              callback=lambda: {(state,): count for state, count in pool_status().items() if state != "size"})
+metrics.Gauge("question_bank_refills_running", "Background question bank refills in progress.",
+              callback=lambda: len(bank_refills_running))
+metrics.Counter("feedback_cache_hits_total", "Quiz feedback served from the cache.", callback=lambda: feedback_cache.hits)
+metrics.Counter("feedback_cache_misses_total", "Quiz feedback cache misses.", callback=lambda: feedback_cache.misses)
+metrics.Counter("tutor_cache_hits_total", "AI tutor answers served from the answer cache.", callback=lambda: tutor_answers.hits)
+metrics.Counter("tutor_cache_misses_total", "Cacheable AI tutor questions that needed an LLM call.", callback=lambda: tutor_answers.misses)
+metrics.Gauge("tutor_cache_hit_ratio", "Share of cacheable AI tutor questions answered from the cache.",
+              callback=lambda: tutor_answers.hit_rate)
+metrics.Gauge("tutor_cache_entries", "Answers in the AI tutor answer cache.", callback=lambda: len(tutor_answers))
+metrics.Counter("quiz_seed_cache_hits_total", "Seeded quiz requests replayed from the cache.", callback=lambda: seeded_quizzes.hits)
+metrics.Counter("quiz_seed_cache_misses_total", "Seeded quiz requests that had to be generated or served from the bank.",
+                callback=lambda: seeded_quizzes.misses)
+metrics.Gauge("skill_ratings_loaded", "User/topic skill ratings held in memory.", callback=lambda: len(skills))
+metrics.Gauge("skill_ratings_dirty", "Skill ratings changed since the last checkpoint.", callback=lambda: skills.dirty)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus text exposition of this worker's metrics."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 # ------------------ Health Check ------------------
 @app.get("/health")
-def health():
-    return {
-        "status": "healthy",
-        "groq_api_configured": bool(GROQ_API_KEY),
-        "database": "connected"
-    }
\ No newline at end of file
+async def health():
+    """Real database round trip, pool usage and LLM queue state."""
+    database = await run_in_threadpool(database_status)
+    healthy = database["status"] == "connected"
+    return JSONResponse(
+        status_code=200 if healthy else 503,
+        content={
+            "status": "healthy" if healthy else "unhealthy",
+            "llm_provider": llm.get_provider().name,
+            "groq_api_configured": bool(GROQ_API_KEY),
+            "database": database,
+            "llm": llm.queue_status(),
+        }
+    )
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from datetime import datetime
+
+from sqlalchemy import Boolean, Column, Float, Integer, String, Text, DateTime, ForeignKey, Index, UniqueConstraint
 from database import Base
 
 class User(Base):
@@ -10,23 +12,124 @@ class User(Base):
     password = Column(String)
 
 class Quiz(Base):
+    """A quiz session: the questions one user was given, graded on submit."""
     __tablename__ = "quizzes"
 
     id = Column(Integer, primary_key=True, index=True)
     topic = Column(String)
     user_id = Column(Integer, ForeignKey("users.id"))
+    session_id = Column(String, unique=True, index=True)
+    style = Column(String)
+    difficulty = Column(String)
+    focuses = Column(Text)  # JSON-encoded list of focus areas
+    created_at = Column(DateTime, default=datetime.utcnow)
+    submitted_at = Column(DateTime)
 
 class Question(Base):
+    """A generated question, stored in the question bank for reuse."""
     __tablename__ = "questions"
 
     id = Column(Integer, primary_key=True, index=True)
     question = Column(String)
-    correct_answer = Column(String)
+    correct_answer = Column("answer", String)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"))
+    topic_key = Column(String)
+    style = Column(String)
+    difficulty = Column(String)
+    options = Column(Text)  # JSON-encoded list of 4 options
+    explanation = Column(Text)
+    serve_count = Column(Integer, default=0, server_default="0")
+    content_hash = Column(String)  # see corpus.content_hash
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_questions_bank_lookup", "topic_key", "style", "difficulty", "serve_count"),
+        Index("ix_questions_content_hash", "content_hash"),
+    )
+
+class QuestionServed(Base):
+    """Records which bank questions a user has already been given."""
+    __tablename__ = "questions_served"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer)
+    question_id = Column(Integer, ForeignKey("questions.id"))
+
+    __table_args__ = (UniqueConstraint("user_id", "question_id"),)
+
+class QuizQuestion(Base):
+    """One question of a quiz session, in the order it was shown, and the answer given."""
+    __tablename__ = "quiz_questions"
+
+    id = Column(Integer, primary_key=True, index=True)
     quiz_id = Column(Integer, ForeignKey("quizzes.id"))
+    position = Column(Integer)
+    question_id = Column(Integer, ForeignKey("questions.id"))
+    chosen = Column(String)
+    is_correct = Column(Boolean)
+
+    __table_args__ = (
+        UniqueConstraint("quiz_id", "position"),
+        Index("ix_quiz_questions_question_id", "question_id"),
+    )
 
 class Score(Base):
+    """One graded quiz attempt. Aggregates below are updated in the same transaction."""
     __tablename__ = "scores"
 
     id = Column(Integer, primary_key=True, index=True)
     value = Column(Integer)
     user_id = Column(Integer, ForeignKey("users.id"))
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"))
+    total = Column(Integer)
+    topic = Column(String)
+    topic_key = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_scores_user_time", "user_id", "created_at"),
+        Index("ix_scores_user_topic_time", "user_id", "topic_key", "created_at"),
+        Index("ix_scores_topic_time", "topic_key", "created_at"),
+    )
+
+class UserTopicStats(Base):
+    """Running totals of one user's attempts on one topic."""
+    __tablename__ = "user_topic_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    topic_key = Column(String, primary_key=True)
+    topic = Column(String)
+    attempts = Column(Integer, default=0, server_default="0")
+    correct = Column(Integer, default=0, server_default="0")
+    questions = Column(Integer, default=0, server_default="0")
+    best_percentage = Column(Integer, default=0, server_default="0")
+    last_percentage = Column(Integer)
+    last_attempt_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_user_topic_stats_recent", "user_id", "last_attempt_at"),
+    )
+
+class LeaderboardEntry(Base):
+    """The best users of a topic; at most LEADERBOARD_SIZE rows per topic are kept."""
+    __tablename__ = "leaderboard_entries"
+
+    topic_key = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    best_percentage = Column(Integer)
+    achieved_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_leaderboard_rank", "topic_key", "best_percentage", "achieved_at"),
+    )
+
+class SkillRating(Base):
+    """Checkpoint of a user's skill on a topic; the live copy is in skill.SkillModel."""
+    __tablename__ = "skill_ratings"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    topic_key = Column(String, primary_key=True)
+    rating = Column(Float)
+    answers = Column(Integer, default=0, server_default="0")
+    focus_scores = Column(Text)  # JSON object: focus area -> recent accuracy
+    updated_at = Column(DateTime)
@@ -0,0 +1,128 @@
+# passwords.py
+"""Password hashing with scrypt, run off the event loop.
+
+Hashes are stored as ``scrypt$<n>$<r>$<p>$<salt>$<hash>`` (base64 salt and
+hash), so each record carries the cost it was created with. Verifying a
+record made with weaker parameters than the current ones (or a legacy
+plaintext password) reports that it needs rehashing, and the caller
+upgrades it after a successful login.
+
+Hashing is CPU-heavy by design. It runs in a small dedicated thread pool
+(``hashlib.scrypt`` releases the GIL), and at most PASSWORD_HASH_MAX_PENDING
+hashes may wait at once. A login storm therefore queues here, or gets a 503,
+instead of occupying the threadpool and event loop the quiz endpoints use.
+
+Environment:
+    PASSWORD_SCRYPT_N           CPU/memory cost, a power of two (default: 16384)
+    PASSWORD_SCRYPT_R           block size (default: 8)
+    PASSWORD_SCRYPT_P           parallelism (default: 1)
+    PASSWORD_HASH_WORKERS       hashing threads (default: min(4, CPU count))
+    PASSWORD_HASH_MAX_PENDING   hashes allowed to run or wait (default: 64)
+    PASSWORD_HASH_WAIT_SECONDS  how long to wait for a slot before a 503 (default: 5)
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+PREFIX = "scrypt"
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+def current_params():
+    return (
+        int(os.getenv("PASSWORD_SCRYPT_N", "16384")),
+        int(os.getenv("PASSWORD_SCRYPT_R", "8")),
+        int(os.getenv("PASSWORD_SCRYPT_P", "1")),
+    )
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(
+        password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+        maxmem=256 * n * r * p + (1 << 20), dklen=KEY_BYTES,
+    )
+
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+def hash_password(password):
+    """Return a self-describing scrypt hash of ``password`` (blocking)."""
+    n, r, p = current_params()
+    salt = os.urandom(SALT_BYTES)
+    return f"{PREFIX}${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+
+
+def verify_password(password, stored):
+    """Check ``password`` against a stored value (blocking).
+
+    Returns (matches, needs_rehash). Values without the scrypt prefix are
+    treated as legacy plaintext passwords.
+    """
+    if not stored:
+        return False, False
+    if not stored.startswith(PREFIX + "$"):
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8")), True
+    try:
+        _, n, r, p, salt, expected = stored.split("$")
+        n, r, p = int(n), int(r), int(p)
+        actual = _scrypt(password, base64.b64decode(salt), n, r, p)
+    except (ValueError, TypeError):
+        return False, False
+    if not hmac.compare_digest(actual, base64.b64decode(expected)):
+        return False, False
+    cur_n, cur_r, cur_p = current_params()
+    return True, n < cur_n or r < cur_r or p < cur_p
+
+
+_executor = None
+_slots = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        workers = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+        _executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="password-hash")
+    return _executor
+
+
+def _get_slots():
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64")))
+    return _slots
+
+
+async def _run(fn, *args):
+    slots = _get_slots()
+    try:
+        await asyncio.wait_for(slots.acquire(), timeout=float(os.getenv("PASSWORD_HASH_WAIT_SECONDS", "5")))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Server is busy. Please try signing in again in a moment.")
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+    finally:
+        slots.release()
+
+
+async def hash_password_async(password):
+    return await _run(hash_password, password)
+
+
+async def verify_password_async(password, stored):
+    return await _run(verify_password, password, stored)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
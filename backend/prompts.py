@@ -0,0 +1,262 @@
+# prompts.py
+"""Prompt templates and the quiz variation tables.
+
+The variation tables are built once at import. Every template is parsed
+once into literal text and named slots (``PromptTemplate``). The quiz
+prompt is pre-bound for each (question style, difficulty) pair, so a
+request only fills in its dynamic slots: topic, counts, seed, focus areas
+and the avoidance list.
+"""
+import string
+
+# ------------------ Variation tables ------------------
+# Instructions may use {topic}; it is filled in per request
+QUESTION_TYPES = (
+    {
+        "style": "Definition & Concept-Based",
+        "instruction": "Focus on 'What is...', 'Define...', 'Explain the concept of...' type questions",
+        "approach": "theoretical understanding and definitions"
+    },
+    {
+        "style": "Application & Problem-Solving",
+        "instruction": "Focus on 'How would you...', 'What happens when...', 'Solve this problem...' type questions",
+        "approach": "practical application and hands-on scenarios"
+    },
+    {
+        "style": "Comparison & Analysis",
+        "instruction": "Focus on 'Compare...', 'What is the difference...', 'Which is better...' type questions",
+        "approach": "comparing alternatives and analyzing trade-offs"
+    },
+    {
+        "style": "Real-World Scenarios",
+        "instruction": "Focus on 'In a real project...', 'A developer needs to...', scenario-based questions",
+        "approach": "real-world situations and case studies"
+    },
+    {
+        "style": "Debugging & Troubleshooting",
+        "instruction": "Focus on 'What's wrong with...', 'How to fix...', 'Why does this fail...' type questions",
+        "approach": "identifying and fixing errors"
+    },
+    {
+        "style": "Best Practices & Optimization",
+        "instruction": "Focus on 'What is the best way...', 'How to optimize...', 'Which approach is recommended...'",
+        "approach": "industry best practices and optimization techniques"
+    },
+    {
+        "style": "Advanced & Edge Cases",
+        "instruction": "Focus on advanced topics, edge cases, and uncommon scenarios in {topic}",
+        "approach": "challenging and advanced concepts"
+    },
+    {
+        "style": "Beginner-Friendly Fundamentals",
+        "instruction": "Focus on basic, foundational questions suitable for beginners learning {topic}",
+        "approach": "simple and fundamental concepts"
+    },
+)
+
+DIFFICULTY_LEVELS = (
+    {
+        "level": "Easy",
+        "instruction": "Make questions straightforward with clear correct answers. Suitable for beginners."
+    },
+    {
+        "level": "Medium",
+        "instruction": "Make questions moderately challenging, requiring good understanding of the topic."
+    },
+    {
+        "level": "Hard",
+        "instruction": "Make questions challenging and thought-provoking, requiring deep knowledge."
+    },
+    {
+        "level": "Mixed",
+        "instruction": "Include a mix of easy, medium, and hard questions."
+    },
+)
+
+FOCUS_AREAS = (
+    "syntax and structure",
+    "common use cases",
+    "error handling",
+    "performance considerations",
+    "security aspects",
+    "design patterns",
+    "integration with other technologies",
+    "version differences and updates",
+    "common mistakes to avoid",
+    "industry standards",
+)
+
+
+# ------------------ Templates ------------------
+class _Slot:
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+
+class PromptTemplate:
+    """A ``str.format``-style template parsed once into literals and named slots.
+
+    ``bind`` fills some slots ahead of time (a value may itself be a
+    PromptTemplate, whose slots are spliced in); ``render`` fills the rest
+    with a single join, without re-parsing the text.
+    """
+
+    def __init__(self, text=None, parts=None):
+        self.parts = parts if parts is not None else self._parse(text)
+        self.slots = frozenset(p.name for p in self.parts if isinstance(p, _Slot))
+
+    @staticmethod
+    def _parse(text):
+        parts = []
+        for literal, field, spec, conversion in string.Formatter().parse(text):
+            if literal:
+                parts.append(literal)
+            if field is not None:
+                if not field or spec or conversion:
+                    raise ValueError(f"Unsupported template field: {{{field}}}")
+                parts.append(_Slot(field))
+        return parts
+
+    def bind(self, **values):
+        parts = []
+        for part in self.parts:
+            if isinstance(part, _Slot) and part.name in values:
+                value = values[part.name]
+                parts.extend(value.parts if isinstance(value, PromptTemplate) else [str(value)])
+            else:
+                parts.append(part)
+        # Merge neighbouring literals so render() joins as few pieces as possible
+        merged = []
+        for part in parts:
+            if merged and isinstance(part, str) and isinstance(merged[-1], str):
+                merged[-1] += part
+            else:
+                merged.append(part)
+        return PromptTemplate(parts=merged)
+
+    def render(self, **values):
+        return "".join(
+            str(values[part.name]) if isinstance(part, _Slot) else part
+            for part in self.parts
+        )
+
+
+QUIZ_PROMPT = PromptTemplate("""🎯 QUIZ GENERATION REQUEST #{attempt}
+
+**TOPIC:** {topic}
+
+**QUESTION TYPE FOR THIS QUIZ:** {style}
+{style_instruction}
+
+**DIFFICULTY LEVEL:** {level}
+{level_instruction}
+
+**CONTENT FOCUS:** Your questions should cover these aspects:
+{focuses}
+
+**VARIATION REQUIREMENTS:**
+- This is quiz attempt #{attempt}
+- Use approach: {approach}
+- Random seed: {seed}
+- Make questions UNIQUE and CREATIVE
+- Avoid common/generic questions
+- Use diverse phrasing and examples
+{avoidance_text}
+
+**YOUR TASK:**
+Generate {num_questions} multiple-choice questions about {topic} that follow the "{style}" approach.
+
+**CRITICAL RULES:**
+1. Each question MUST be completely different from previous attempts
+2. Use the "{style}" question style
+3. Each question must have EXACTLY 4 options (A, B, C, D)
+4. Mark one correct_answer clearly
+5. Provide a helpful explanation for each question
+6. Make questions interesting and educational
+7. DO NOT use generic or commonly asked questions
+8. Be creative with examples and scenarios
+
+**OUTPUT FORMAT:**
+Return ONLY a valid JSON array (no markdown, no extra text):
+
+[
+  {{
+    "id": 1,
+    "question": "Your question text here?",
+    "options": ["Option A", "Option B", "Option C", "Option D"],
+    "correct_answer": "Option A",
+    "explanation": "Brief explanation of why this is correct"
+  }}
+]
+
+🚀 Begin generating {num_questions} UNIQUE {style_lower} questions now!""")
+
+QUIZ_SYSTEM_PROMPT = PromptTemplate(
+    "You are a creative quiz generator. Generate UNIQUE questions that are different from "
+    "previous attempts. Current attempt: #{attempt}. Style: {style}"
+)
+
+# One pre-bound prompt per (style, level); only per-request slots remain
+_QUIZ_TEMPLATES = {
+    (qt["style"], dl["level"]): (
+        QUIZ_PROMPT.bind(
+            style=qt["style"],
+            style_lower=qt["style"].lower(),
+            style_instruction=PromptTemplate(qt["instruction"]),
+            approach=qt["approach"],
+            level=dl["level"],
+            level_instruction=dl["instruction"],
+        ),
+        QUIZ_SYSTEM_PROMPT.bind(style=qt["style"]),
+    )
+    for qt in QUESTION_TYPES
+    for dl in DIFFICULTY_LEVELS
+}
+
+
+def quiz_messages(style, level, topic, num_questions, attempt, seed, focuses, avoidance_text):
+    """System and user messages for one quiz generation."""
+    prompt, system = _QUIZ_TEMPLATES[(style, level)]
+    return [
+        {"role": "system", "content": system.render(attempt=attempt)},
+        {"role": "user", "content": prompt.render(
+            topic=topic,
+            num_questions=num_questions,
+            attempt=attempt,
+            seed=seed,
+            focuses=", ".join(focuses),
+            avoidance_text=avoidance_text,
+        )},
+    ]
+
+
+TUTOR_SYSTEM_PROMPT = """You are an intelligent, friendly AI tutor. Your job is to:
+1. Explain concepts clearly and simply
+2. Provide examples when helpful
+3. Answer questions accurately
+4. Encourage learning
+5. Be conversational and supportive
+
+Keep responses concise but informative (2-4 paragraphs usually). Use simple language."""
+
+HISTORY_SUMMARY_PROMPT = PromptTemplate("""Update the summary of a tutoring conversation.
+
+Current summary:
+{previous_summary}
+
+New messages:
+{transcript}
+
+Write the updated summary in at most 150 words. Keep the topics covered, what the student understood or struggled with, and any open questions.""")
+
+FEEDBACK_PROMPT = PromptTemplate("""A student completed a quiz on {topic}.
+Score: about {percentage}%
+
+Provide brief, encouraging feedback (2-3 sentences) that:
+1. Acknowledges their performance
+2. Highlights what they did well
+3. Suggests improvement if score < 80%
+
+Be supportive and constructive. Do not mention an exact score or number of questions.""")
@@ -0,0 +1,272 @@
+# providers.py
+"""LLM provider backends behind llm.py.
+
+A provider turns chat messages into a completion and returns responses in
+the OpenAI/Groq shape the endpoints already read
+(``choices[0].message.content``, ``usage``), or stream chunks with
+``choices[0].delta.content`` and a final usage report. Failures are raised
+as ProviderError (or RateLimited for 429s) so callers never depend on one
+vendor's SDK exceptions.
+
+* ``GroqProvider`` calls the Groq API.
+* ``StubProvider`` runs offline. It answers quiz prompts with valid quiz
+  JSON and everything else with tutor-style text, after a configurable
+  delay and with a configurable failure rate. It is seeded, so load tests
+  and benchmarks are reproducible and need no API key or network.
+
+Environment:
+    LLM_PROVIDER              groq (default) or stub
+    LLM_STUB_LATENCY_MS       mean delay before the first token (default: 200)
+    LLM_STUB_JITTER_MS        +/- random spread on that delay (default: 50)
+    LLM_STUB_CHUNK_MS         delay between streamed chunks (default: 5)
+    LLM_STUB_FAILURE_RATE     fraction of calls failing with a 503 (default: 0)
+    LLM_STUB_RATE_LIMIT_RATE  fraction of calls failing with a 429 (default: 0)
+    LLM_STUB_SEED             seed for content, latency and failures (default: 0)
+"""
+import asyncio
+import json
+import os
+import random
+import re
+from types import SimpleNamespace
+
+
+class ProviderError(Exception):
+    """A provider call failed. ``status_code`` is None for connection failures."""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class RateLimited(ProviderError):
+    """The provider answered 429."""
+
+
+class LLMProvider:
+    """Interface every backend implements."""
+
+    name = "base"
+
+    @property
+    def configured(self):
+        """False when required settings (such as an API key) are missing."""
+        return True
+
+    async def complete(self, messages, **params):
+        raise NotImplementedError
+
+    async def open_stream(self, messages, **params):
+        """Start a streaming completion and return an async iterator of chunks."""
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+
+# ------------------ Groq ------------------
+class GroqProvider(LLMProvider):
+    """Groq API through one pooled AsyncGroq client, created on first use."""
+
+    name = "groq"
+
+    def __init__(self, api_key=None, max_connections=256):
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self._client = None
+
+    @property
+    def configured(self):
+        return bool(self.api_key)
+
+    def client(self):
+        if self._client is None:
+            import httpx
+            from groq import AsyncGroq, DefaultAsyncHttpxClient
+
+            self._client = AsyncGroq(
+                api_key=self.api_key,
+                max_retries=0,  # retries are handled in llm.py
+                http_client=DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=min(self.max_connections, 64),
+                    )
+                ),
+            )
+        return self._client
+
+    @staticmethod
+    def _translate(exc):
+        from groq import APIConnectionError, APIStatusError, RateLimitError
+
+        if isinstance(exc, (APIStatusError, APIConnectionError)):
+            retry_after = None
+            response = getattr(exc, "response", None)
+            if response is not None:
+                try:
+                    retry_after = float(response.headers.get("retry-after", ""))
+                except ValueError:
+                    pass
+            error_type = RateLimited if isinstance(exc, RateLimitError) else ProviderError
+            return error_type(str(exc), getattr(exc, "status_code", None), retry_after)
+        return exc
+
+    async def complete(self, messages, **params):
+        try:
+            return await self.client().chat.completions.create(messages=messages, **params)
+        except Exception as e:
+            raise self._translate(e) from e
+
+    async def open_stream(self, messages, **params):
+        try:
+            stream = await self.client().chat.completions.create(messages=messages, stream=True, **params)
+        except Exception as e:
+            raise self._translate(e) from e
+        return self._iterate(stream)
+
+    async def _iterate(self, stream):
+        try:
+            async for chunk in stream:
+                yield chunk
+        except Exception as e:
+            raise self._translate(e) from e
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+# ------------------ Offline stub ------------------
+STUB_WORDS = (
+    "array graph vector matrix signal energy orbit protein market contract "
+    "theorem sample network cell enzyme climate river empire treaty voltage "
+    "pressure lens grammar rhythm algorithm query kernel thread memory cache "
+    "island glacier mineral fossil equation ratio angle tangent integral "
+    "population budget ledger poem novel canvas melody circuit magnet wave"
+).split()
+
+QUIZ_PROMPT = re.compile(r"Generate (\d+) multiple-choice questions about (.+?) that")
+
+
+def _stub_response(content, prompt_tokens, completion_tokens):
+    usage = SimpleNamespace(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content), finish_reason="stop")],
+        usage=usage,
+    )
+
+
+def _stub_chunk(content=None, usage=None):
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=content))] if content is not None else []
+    return SimpleNamespace(choices=choices, usage=None, x_groq=SimpleNamespace(usage=usage) if usage else None)
+
+
+class StubProvider(LLMProvider):
+    """Deterministic offline provider for load tests and local development."""
+
+    name = "stub"
+
+    def __init__(self, latency_ms=200, jitter_ms=50, chunk_ms=5, failure_rate=0.0,
+                 rate_limit_rate=0.0, seed=0, chunk_size=16):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.chunk_ms = chunk_ms
+        self.failure_rate = failure_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.chunk_size = chunk_size
+        self._rng = random.Random(seed)
+        self.calls = 0
+
+    def _delay(self):
+        return max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+    def _maybe_fail(self):
+        roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            raise RateLimited("stub provider: rate limited", 429, retry_after=1.0)
+        if roll < self.rate_limit_rate + self.failure_rate:
+            raise ProviderError("stub provider: service unavailable", 503)
+
+    def _sentence(self, count):
+        return " ".join(self._rng.sample(STUB_WORDS, count))
+
+    def _quiz(self, count, topic):
+        questions = []
+        for i in range(count):
+            options = [f"{self._sentence(2)} ({letter})" for letter in "ABCD"]
+            questions.append({
+                "id": i + 1,
+                "question": f"In {topic}, how does {self._sentence(6)} relate to {self._sentence(3)}?",
+                "options": options,
+                "correct_answer": options[self._rng.randrange(4)],
+                "explanation": f"Because {self._sentence(8)}.",
+            })
+        return json.dumps(questions, indent=2)
+
+    def _text(self):
+        sentences = [f"Here is a short explanation about {self._sentence(3)}."]
+        sentences += [f"{self._sentence(10).capitalize()}." for _ in range(3)]
+        return " ".join(sentences)
+
+    def _content(self, messages):
+        match = QUIZ_PROMPT.search(messages[-1]["content"]) if messages else None
+        if match:
+            return self._quiz(int(match.group(1)), match.group(2).strip())
+        return self._text()
+
+    @staticmethod
+    def _prompt_tokens(messages):
+        return sum(len(m.get("content") or "") // 4 + 4 for m in messages)
+
+    def _chunks(self, content):
+        return [content[i:i + self.chunk_size] for i in range(0, len(content), self.chunk_size)]
+
+    async def complete(self, messages, **params):
+        self.calls += 1
+        await asyncio.sleep(self._delay())
+        self._maybe_fail()
+        content = self._content(messages)
+        await asyncio.sleep(len(self._chunks(content)) * self.chunk_ms / 1000)
+        return _stub_response(content, self._prompt_tokens(messages), len(content) // 4 + 1)
+
+    async def open_stream(self, messages, **params):
+        self.calls += 1
+        await asyncio.sleep(self._delay())
+        self._maybe_fail()
+        content = self._content(messages)
+        return self._iterate(content, self._prompt_tokens(messages))
+
+    async def _iterate(self, content, prompt_tokens):
+        for piece in self._chunks(content):
+            yield _stub_chunk(piece)
+            await asyncio.sleep(self.chunk_ms / 1000)
+        completion_tokens = len(content) // 4 + 1
+        yield _stub_chunk(usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+        ))
+
+
+def create_provider(max_connections=256):
+    """Build the provider selected by LLM_PROVIDER."""
+    name = os.getenv("LLM_PROVIDER", "groq").lower()
+    if name == "stub":
+        return StubProvider(
+            latency_ms=float(os.getenv("LLM_STUB_LATENCY_MS", "200")),
+            jitter_ms=float(os.getenv("LLM_STUB_JITTER_MS", "50")),
+            chunk_ms=float(os.getenv("LLM_STUB_CHUNK_MS", "5")),
+            failure_rate=float(os.getenv("LLM_STUB_FAILURE_RATE", "0")),
+            rate_limit_rate=float(os.getenv("LLM_STUB_RATE_LIMIT_RATE", "0")),
+            seed=int(os.getenv("LLM_STUB_SEED", "0")),
+        )
+    if name != "groq":
+        raise ValueError(f"Unknown LLM_PROVIDER: {name}")
+    return GroqProvider(api_key=os.getenv("GROQ_API_KEY"), max_connections=max_connections)
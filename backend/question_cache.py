@@ -0,0 +1,195 @@
+# question_cache.py
+"""Bounded caches of recently generated question texts, keyed by topic.
+
+The quiz endpoints use these to tell the model which questions to avoid.
+Two backends share one interface:
+
+    MemoryRecentQuestionsCache  per-process, lock-protected OrderedDict
+    SQLiteRecentQuestionsCache  stored in SQLite, shared by all workers
+
+Both enforce a per-topic cap, a total entry cap (evicting least recently
+used topics first) and a TTL on individual entries.
+
+Environment:
+    QUESTION_CACHE_BACKEND      "memory" (default) or "sqlite"
+    QUESTION_CACHE_MAX_ENTRIES  total questions kept across topics (default: 10000)
+    QUESTION_CACHE_PER_TOPIC    questions kept per topic (default: 20)
+    QUESTION_CACHE_TTL          seconds before an entry expires (default: 86400)
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from sqlalchemy import Column, Float, Index, Integer, MetaData, String, Table, Text, delete, func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+
+class RecentQuestionsCache:
+    """Interface shared by the cache backends."""
+
+    def __init__(self, max_entries=10000, per_topic=20, ttl=86400):
+        self.max_entries = max_entries
+        self.per_topic = per_topic
+        self.ttl = ttl
+
+    def setup(self):
+        """Create any storage the backend needs; called once at startup."""
+
+    def get(self, topic_key):
+        """Return the cached question texts for a topic, oldest first."""
+        raise NotImplementedError
+
+    def add(self, topic_key, questions):
+        """Append question texts to a topic, evicting as needed."""
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class MemoryRecentQuestionsCache(RecentQuestionsCache):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._topics = OrderedDict()  # topic_key -> deque[(added_at, text)]
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, topic_key):
+        with self._lock:
+            entries = self._topics.get(topic_key)
+            if entries is None:
+                return []
+            self._expire(topic_key, entries, time.time())
+            if topic_key not in self._topics:
+                return []
+            self._topics.move_to_end(topic_key)
+            return [text for _, text in entries]
+
+    def add(self, topic_key, questions):
+        now = time.time()
+        with self._lock:
+            entries = self._topics.get(topic_key)
+            if entries is None:
+                entries = self._topics[topic_key] = deque()
+            self._topics.move_to_end(topic_key)
+            for text in questions:
+                entries.append((now, text))
+                self._size += 1
+            while len(entries) > self.per_topic:
+                entries.popleft()
+                self._size -= 1
+            self._expire(topic_key, entries, now)
+            self._evict()
+
+    def __len__(self):
+        return self._size
+
+    def _expire(self, topic_key, entries, now):
+        cutoff = now - self.ttl
+        while entries and entries[0][0] < cutoff:
+            entries.popleft()
+            self._size -= 1
+        if not entries:
+            del self._topics[topic_key]
+
+    def _evict(self):
+        # Drop the oldest entries of the least recently used topics first
+        while self._size > self.max_entries and self._topics:
+            topic_key, entries = next(iter(self._topics.items()))
+            entries.popleft()
+            self._size -= 1
+            if not entries:
+                del self._topics[topic_key]
+
+
+class SQLiteRecentQuestionsCache(RecentQuestionsCache):
+    """Cache stored in SQLite so every uvicorn worker sees the same history."""
+
+    metadata = MetaData()
+    entries = Table(
+        "recent_questions",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("topic_key", String, nullable=False),
+        Column("question", Text, nullable=False),
+        Column("added_at", Float, nullable=False),
+        Index("ix_recent_questions_topic", "topic_key", "added_at"),
+    )
+    topics = Table(
+        "recent_question_topics",
+        metadata,
+        Column("topic_key", String, primary_key=True),
+        Column("last_used", Float, nullable=False, index=True),
+    )
+
+    def __init__(self, engine, **kwargs):
+        super().__init__(**kwargs)
+        self.engine = engine
+
+    def setup(self):
+        self.metadata.create_all(self.engine)
+
+    def get(self, topic_key):
+        now = time.time()
+        with self.engine.begin() as conn:
+            rows = conn.execute(
+                select(self.entries.c.question)
+                .where(self.entries.c.topic_key == topic_key, self.entries.c.added_at >= now - self.ttl)
+                .order_by(self.entries.c.added_at, self.entries.c.id)
+            ).scalars().all()
+            if rows:
+                conn.execute(
+                    update(self.topics).where(self.topics.c.topic_key == topic_key).values(last_used=now)
+                )
+        return list(rows)
+
+    def add(self, topic_key, questions):
+        if not questions:
+            return
+        now = time.time()
+        e, t = self.entries, self.topics
+        with self.engine.begin() as conn:
+            conn.execute(e.insert(), [{"topic_key": topic_key, "question": q, "added_at": now} for q in questions])
+            conn.execute(
+                sqlite_insert(t).values(topic_key=topic_key, last_used=now)
+                .on_conflict_do_update(index_elements=[t.c.topic_key], set_={"last_used": now})
+            )
+
+            # Per-topic cap: keep only the newest per_topic entries
+            keep = select(e.c.id).where(e.c.topic_key == topic_key).order_by(e.c.added_at.desc(), e.c.id.desc()).limit(self.per_topic)
+            conn.execute(delete(e).where(e.c.topic_key == topic_key, e.c.id.not_in(keep)))
+
+            # TTL
+            conn.execute(delete(e).where(e.c.added_at < now - self.ttl))
+
+            # Total cap: evict entries of the least recently used topics
+            excess = conn.execute(select(func.count()).select_from(e)).scalar() - self.max_entries
+            if excess > 0:
+                victims = (
+                    select(e.c.id)
+                    .join(t, t.c.topic_key == e.c.topic_key, isouter=True)
+                    .order_by(t.c.last_used, e.c.added_at)
+                    .limit(excess)
+                )
+                conn.execute(delete(e).where(e.c.id.in_(victims)))
+            conn.execute(delete(t).where(t.c.topic_key.not_in(select(e.c.topic_key))))
+
+    def __len__(self):
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(self.entries)).scalar()
+
+
+def create_recent_questions_cache(engine):
+    """Build the backend selected by QUESTION_CACHE_BACKEND."""
+    options = {
+        "max_entries": int(os.getenv("QUESTION_CACHE_MAX_ENTRIES", "10000")),
+        "per_topic": int(os.getenv("QUESTION_CACHE_PER_TOPIC", "20")),
+        "ttl": int(os.getenv("QUESTION_CACHE_TTL", "86400")),
+    }
+    backend = os.getenv("QUESTION_CACHE_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        return SQLiteRecentQuestionsCache(engine, **options)
+    if backend == "memory":
+        return MemoryRecentQuestionsCache(**options)
+    raise ValueError(f"Unknown QUESTION_CACHE_BACKEND: {backend}")
@@ -0,0 +1,203 @@
+# quiz_parser.py
+"""Parsing and validation of LLM quiz output.
+
+``QuestionStreamParser`` consumes the model's text incrementally and hands
+back each question object as soon as its closing brace arrives, so callers
+can forward questions to the client while the rest of the array is still
+being generated.
+
+``parse_questions`` is the lenient batch counterpart: it repairs common
+formatting slips, keeps every question that validates and reports how many
+were dropped, so callers only need to regenerate the shortfall.
+"""
+import json
+import re
+
+REQUIRED_KEYS = ("question", "options", "correct_answer")
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_LETTER_ANSWER = re.compile(r"^\(?([A-Da-d])[\).:]?$")
+
+
+def validate_question(q):
+    """Raise ValueError if ``q`` is not a usable multiple-choice question."""
+    if not isinstance(q, dict):
+        raise ValueError("Question must be a JSON object")
+    if not all(key in q for key in REQUIRED_KEYS):
+        raise ValueError("Missing required fields in question")
+    if not isinstance(q["question"], str) or not q["question"].strip():
+        raise ValueError("Question text must be a non-empty string")
+    if not isinstance(q["options"], list) or len(q["options"]) != 4:
+        raise ValueError("Each question must have exactly 4 options")
+    if q["correct_answer"] not in q["options"]:
+        raise ValueError("correct_answer must be one of the options")
+
+
+def repair_json(text):
+    """Best-effort fix-ups for near-valid JSON emitted by the model."""
+    text = _TRAILING_COMMA.sub(r"\1", text)
+    return json.loads(text, strict=False)  # strict=False allows raw newlines in strings
+
+
+def normalize_question(q):
+    """Coerce common near-misses into the expected shape, in place.
+
+    Options given as {"A": ..., "B": ...} become a list, and a correct_answer
+    given as a letter ("B", "b)", "(C)") is replaced by that option's text.
+    """
+    if not isinstance(q, dict):
+        return q
+    if isinstance(q.get("options"), dict):
+        q["options"] = list(q["options"].values())
+    options, answer = q.get("options"), q.get("correct_answer")
+    if isinstance(options, list) and isinstance(answer, str) and answer not in options:
+        match = _LETTER_ANSWER.match(answer.strip())
+        if match and len(options) == 4:
+            q["correct_answer"] = options["ABCD".index(match.group(1).upper())]
+    return q
+
+
+def _unwrap(value):
+    """The list of question objects in a decoded response, or None."""
+    if isinstance(value, list):
+        return value
+    if isinstance(value, dict):
+        if "question" in value:
+            return [value]
+        # {"questions": [...]} and similar wrappers
+        for item in value.values():
+            if isinstance(item, list) and item and all(isinstance(i, dict) for i in item):
+                return item
+    return None
+
+
+def _decode_whole(raw_text):
+    """Decode the response as one JSON document, outermost brackets first."""
+    spans = [("[", "]"), ("{", "}")]
+    object_at = raw_text.find("{")
+    if -1 < object_at < raw_text.find("[") or raw_text.find("[") == -1:
+        spans.reverse()
+    for open_ch, close_ch in spans:
+        start, end = raw_text.find(open_ch), raw_text.rfind(close_ch)
+        if start == -1 or end <= start:
+            continue
+        try:
+            items = _unwrap(repair_json(raw_text[start:end + 1]))
+        except ValueError:
+            continue
+        if items is not None:
+            return items
+    return None
+
+
+def _scan_items(raw_text):
+    """Questions from the first array that yields any, object by object; returns (items, errors)."""
+    start = raw_text.find("[")
+    while start != -1:
+        parser = QuestionStreamParser()
+        items = parser.feed(raw_text[start:])
+        if items or parser.errors:
+            return items, len(parser.errors)
+        start = raw_text.find("[", start + 1)  # e.g. a "[2]" in a preamble
+    # No array at all: bare objects, parsed as if wrapped
+    parser = QuestionStreamParser()
+    items = parser.feed(f"[{raw_text}]")
+    return items, len(parser.errors)
+
+
+def parse_questions(raw_text):
+    """Extract every valid question from a model response.
+
+    Returns (questions, rejected) where rejected counts objects that could
+    not be decoded or failed validation. The response is first decoded as a
+    whole (unwrapping ``{"questions": [...]}``); if that fails, objects are
+    decoded one at a time, so a truncated or partly malformed response still
+    yields the questions that were complete.
+    """
+    items, rejected = _decode_whole(raw_text), 0
+    if items is None:
+        items, rejected = _scan_items(raw_text)
+    questions = []
+    for q in items:
+        q = normalize_question(q)
+        try:
+            validate_question(q)
+        except ValueError:
+            rejected += 1
+            continue
+        questions.append(q)
+    return questions, rejected
+
+
+class QuestionStreamParser:
+    """Incremental parser for a JSON array of question objects.
+
+    Text before the opening ``[`` (markdown fences, preambles) is skipped.
+    Each top-level object inside the array is decoded independently, so a
+    malformed object does not prevent later ones from being parsed.
+    """
+
+    def __init__(self):
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buffer = []
+        self.errors = []
+
+    @property
+    def finished(self):
+        return self._finished
+
+    def feed(self, text):
+        """Consume a chunk of text and return the objects it completed."""
+        completed = []
+        for ch in text:
+            if self._finished:
+                break
+            if not self._started:
+                if ch == "[":
+                    self._started = True
+                continue
+
+            if self._depth > 0:
+                self._buffer.append(ch)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0:
+                    self._buffer = [ch]
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    if ch == "]":
+                        self._finished = True
+                    continue
+                self._depth -= 1
+                if self._depth == 0:
+                    item = self._decode("".join(self._buffer))
+                    if item is not None:
+                        completed.append(item)
+                    self._buffer = []
+        return completed
+
+    def _decode(self, text):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            pass
+        try:
+            return repair_json(text)
+        except json.JSONDecodeError as e:
+            self.errors.append(str(e))
+            return None
@@ -0,0 +1,155 @@
+# ratelimit.py
+"""In-process token-bucket rate limiting.
+
+Two layers protect the LLM provider:
+
+* ``KeyedBuckets`` gives every (endpoint, user) pair its own bucket. The
+  AI endpoints check it up front and answer 429 with Retry-After when a
+  single user is going too fast.
+* ``ProviderLimiter`` sits in front of every provider call in llm.py and
+  enforces the worker's global request-per-minute and token-per-minute
+  budget. Calls that would exceed it wait in line (up to a bounded time)
+  instead of being sent and throttled by the provider. Token usage is only
+  known after a response, so it is debited afterwards and the bucket can go
+  into debt; new calls wait until it is paid back.
+
+Limits are per worker process. Divide the provider's quota by the number
+of workers when configuring them.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+
+class ProviderBusy(Exception):
+    """The global LLM budget is exhausted and the wait would be too long."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"LLM request budget exhausted, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Refills at ``rate`` tokens per second up to ``capacity``."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount=1.0, now=None):
+        """Take ``amount`` tokens if available. Returns 0, or the seconds to wait."""
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def debit(self, amount, now=None):
+        """Remove tokens that were already spent; the balance may go negative."""
+        self._refill(time.monotonic() if now is None else now)
+        self.tokens -= amount
+
+    def wait_time(self, now=None):
+        """Seconds until the balance is positive again."""
+        self._refill(time.monotonic() if now is None else now)
+        return 0.0 if self.tokens > 0 else (1 - self.tokens) / self.rate
+
+
+class KeyedBuckets:
+    """One TokenBucket per key, with the least recently used keys dropped first."""
+
+    def __init__(self, rate, capacity, max_keys=100000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def take(self, key, amount=1.0):
+        """Returns 0 if allowed, otherwise the seconds until ``key`` may retry."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            return self._bucket(key).take(amount)
+
+    def charge(self, key, amount):
+        """Like ``take`` for costs that may exceed the burst.
+
+        A full bucket (or ``amount``, if smaller) must be available; the rest
+        is debited, so a large request goes through but the caller then waits
+        until the bucket has paid it off.
+        """
+        if self.rate <= 0 or amount <= 0:
+            return 0.0
+        upfront = min(amount, self.capacity)
+        with self._lock:
+            bucket = self._bucket(key)
+            wait = bucket.take(upfront)
+            if not wait:
+                bucket.debit(amount - upfront)
+            return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class ProviderLimiter:
+    """Global requests-per-minute and tokens-per-minute budget for LLM calls.
+
+    A limit of 0 disables that dimension. ``acquire`` waits up to
+    ``max_wait`` seconds for budget and raises ProviderBusy otherwise.
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, max_wait=10.0):
+        self.requests = TokenBucket(requests_per_minute / 60, max(1, requests_per_minute / 6)) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute / 6) if tokens_per_minute > 0 else None
+        self.max_wait = max_wait
+        self.waiting = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def _try_acquire(self):
+        with self._lock:
+            wait = self.tokens.wait_time() if self.tokens else 0.0
+            if wait:
+                return wait
+            return self.requests.take() if self.requests else 0.0
+
+    async def acquire(self):
+        deadline = time.monotonic() + self.max_wait
+        wait = self._try_acquire()
+        if not wait:
+            return
+        self.waiting += 1
+        try:
+            while wait:
+                remaining = deadline - time.monotonic()
+                if wait > remaining:
+                    self.rejected += 1
+                    raise ProviderBusy(wait)
+                await asyncio.sleep(wait)
+                wait = self._try_acquire()
+        finally:
+            self.waiting -= 1
+
+    def record_tokens(self, total_tokens):
+        if self.tokens and total_tokens:
+            with self._lock:
+                self.tokens.debit(total_tokens)
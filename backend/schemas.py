@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from pydantic import BaseModel
 
 class UserCreate(BaseModel):
@@ -11,4 +13,37 @@ class UserResponse(BaseModel):
     email: str
 
     class Config:
-        orm_mode = True
+        from_attributes = True
+
+class UserRegister(BaseModel):
+    name: str
+    email: str
+    password: str
+
+class UserLogin(BaseModel):
+    email: str
+    password: str
+
+class Topic(BaseModel):
+    topic: str
+    num_questions: Optional[int] = 5
+    timestamp: Optional[int] = None
+    seed: Optional[int] = None
+    attempt: Optional[int] = 1
+    difficulty: Optional[str] = None
+    variation_prompt: Optional[str] = None
+    request_id: Optional[str] = None
+    force_new: Optional[bool] = False
+    user_id: Optional[int] = None  # ignored: the caller is taken from the auth token
+
+class QuizSubmission(BaseModel):
+    answers: List[Optional[str]]  # chosen option per question, in quiz order
+
+class BulkQuizItem(BaseModel):
+    topic: str
+    num_questions: Optional[int] = 5
+    difficulty: Optional[str] = None  # Easy, Medium, Hard or Mixed; when omitted, picked once from the caller's schedule and shared by every student
+
+class BulkQuizRequest(BaseModel):
+    items: List[BulkQuizItem]
+    roster: Optional[List[str]] = None  # student emails; each gets every item
@@ -0,0 +1,170 @@
+# scoreboard.py
+"""Score history aggregates for the progress and leaderboard endpoints.
+
+Every graded attempt is one row in ``scores``. Reading progress or a
+leaderboard from that table would mean scanning a user's or a topic's
+whole history, so two small tables are kept up to date in the same
+transaction as the score insert:
+
+    user_topic_stats     per (user, topic): attempts, correct and total
+                         answers, best and last percentage
+    leaderboard_entries  per topic: the LEADERBOARD_SIZE users with the
+                         best percentage (earliest first on ties)
+
+Each write touches one stats row and at most LEADERBOARD_SIZE + 1
+leaderboard rows. Reads hit an index and return at most a page of rows,
+however long the history gets.
+
+Environment:
+    LEADERBOARD_SIZE  users kept per topic leaderboard (default: 10)
+"""
+import os
+from datetime import datetime
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import LeaderboardEntry, Quiz, Score, User, UserTopicStats
+
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "10"))
+
+
+def percentage(correct, total):
+    return int(correct * 100 / total) if total else 0
+
+
+def record_score(db, user_id, topic, topic_key, value, total, quiz_id=None, now=None):
+    """Insert a score and update the aggregates; the caller commits."""
+    now = now or datetime.utcnow()
+    db.add(Score(value=value, total=total, user_id=user_id, quiz_id=quiz_id,
+                 topic=topic, topic_key=topic_key, created_at=now))
+    if user_id is not None:
+        _update_aggregates(db, user_id, topic, topic_key, value, total, now)
+
+
+def _update_aggregates(db, user_id, topic, topic_key, value, total, now):
+    pct = percentage(value, total)
+    s = UserTopicStats.__table__
+    db.execute(
+        sqlite_insert(s).values(
+            user_id=user_id, topic_key=topic_key, topic=topic, attempts=1, correct=value,
+            questions=total, best_percentage=pct, last_percentage=pct, last_attempt_at=now
+        ).on_conflict_do_update(
+            index_elements=[s.c.user_id, s.c.topic_key],
+            set_={
+                "topic": topic,
+                "attempts": s.c.attempts + 1,
+                "correct": s.c.correct + value,
+                "questions": s.c.questions + total,
+                "best_percentage": func.max(s.c.best_percentage, pct),
+                "last_percentage": pct,
+                "last_attempt_at": now,
+            }
+        )
+    )
+    best = db.execute(
+        select(s.c.best_percentage).where(s.c.user_id == user_id, s.c.topic_key == topic_key)
+    ).scalar()
+    _update_leaderboard(db, user_id, topic_key, best, now)
+
+
+def _update_leaderboard(db, user_id, topic_key, pct, now):
+    # pct is the user's best, so someone trimmed earlier re-enters with it
+    board = LeaderboardEntry.__table__
+    db.execute(
+        sqlite_insert(board).values(topic_key=topic_key, user_id=user_id, best_percentage=pct, achieved_at=now)
+        .on_conflict_do_update(
+            index_elements=[board.c.topic_key, board.c.user_id],
+            set_={"best_percentage": pct, "achieved_at": now},
+            where=board.c.best_percentage < pct
+        )
+    )
+    # Drop whoever fell below the top LEADERBOARD_SIZE
+    keep = (
+        select(board.c.user_id).where(board.c.topic_key == topic_key)
+        .order_by(board.c.best_percentage.desc(), board.c.achieved_at)
+        .limit(LEADERBOARD_SIZE)
+    )
+    db.execute(delete(board).where(board.c.topic_key == topic_key, board.c.user_id.not_in(keep)))
+
+
+def user_progress(db, user_id, recent=10):
+    """Per-topic stats (most recently practised first) and the latest attempts."""
+    topics = db.query(UserTopicStats).filter(UserTopicStats.user_id == user_id).order_by(
+        UserTopicStats.last_attempt_at.desc()
+    ).all()
+    history = db.query(Score).filter(Score.user_id == user_id).order_by(
+        Score.created_at.desc(), Score.id.desc()
+    ).limit(recent).all()
+    return {
+        "topics": [
+            {
+                "topic": row.topic,
+                "attempts": row.attempts,
+                "average_percentage": percentage(row.correct, row.questions),
+                "best_percentage": row.best_percentage,
+                "last_percentage": row.last_percentage,
+                "last_attempt_at": row.last_attempt_at.isoformat() if row.last_attempt_at else None,
+            }
+            for row in topics
+        ],
+        "recent": [
+            {
+                "topic": row.topic,
+                "score": row.value,
+                "total": row.total,
+                "percentage": percentage(row.value, row.total),
+                "at": row.created_at.isoformat() if row.created_at else None,
+            }
+            for row in history
+        ],
+    }
+
+
+def topic_leaderboard(db, topic_key, limit=LEADERBOARD_SIZE):
+    """The stored top users of a topic, best first."""
+    rows = db.query(LeaderboardEntry, User.name).join(User, User.id == LeaderboardEntry.user_id).filter(
+        LeaderboardEntry.topic_key == topic_key
+    ).order_by(LeaderboardEntry.best_percentage.desc(), LeaderboardEntry.achieved_at).limit(limit).all()
+    return [
+        {
+            "rank": rank,
+            "name": name,
+            "best_percentage": entry.best_percentage,
+            "achieved_at": entry.achieved_at.isoformat() if entry.achieved_at else None,
+        }
+        for rank, (entry, name) in enumerate(rows, 1)
+    ]
+
+
+def rebuild(db, normalize_topic):
+    """
+    Recompute the aggregates from the score history.
+
+    Used once for databases that have scores from before the aggregates
+    existed; topics of old scores are filled in from their quiz.
+    """
+    for score_id, topic in db.execute(
+        select(Score.id, Quiz.topic).join(Quiz, Quiz.id == Score.quiz_id).where(Score.topic_key.is_(None))
+    ).all():
+        db.query(Score).filter(Score.id == score_id).update(
+            {Score.topic: topic, Score.topic_key: normalize_topic(topic or "")}, synchronize_session=False
+        )
+    db.query(LeaderboardEntry).delete()
+    db.query(UserTopicStats).delete()
+    rows = db.execute(
+        select(Score.user_id, Score.topic, Score.topic_key, Score.value, Score.total, Score.created_at)
+        .where(Score.user_id.isnot(None), Score.topic_key.isnot(None))
+        .order_by(Score.id)
+    ).all()
+    for row in rows:
+        _update_aggregates(db, row.user_id, row.topic, row.topic_key, row.value or 0, row.total or 0,
+                           row.created_at or datetime.utcnow())
+    db.commit()
+    return len(rows)
+
+
+def needs_rebuild(db):
+    """True if there are scores but no aggregates yet."""
+    has_scores = db.query(Score.id).filter(Score.user_id.isnot(None)).first() is not None
+    return has_scores and db.query(UserTopicStats.user_id).first() is None
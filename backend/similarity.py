@@ -0,0 +1,125 @@
+# similarity.py
+"""CPU-only near-duplicate detection for question texts.
+
+Each question is reduced to a MinHash signature over character shingles of
+its normalized text and its options (see ``signature_text``). The fraction
+of matching signature slots estimates the Jaccard similarity of the shingle
+sets, so reworded copies of an old question ("What is a list in Python?" /
+"In Python, what is a list?", same options in any order) score high. The
+options keep questions that share a stem apart: "Which of the following is
+true about Python tuples?" and the same question about sets score under
+0.3 with their options, and 0.8 on their texts alone.
+
+``QuestionSimilarityIndex`` keeps a bounded number of signatures per topic
+and a bounded number of topics (least recently used topics are dropped).
+"""
+import hashlib
+import random
+import re
+import threading
+from collections import OrderedDict, deque
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def normalize_text(text):
+    """Lowercase, strip punctuation and collapse whitespace."""
+    return " ".join(re.sub(r"[^\w\s]+", " ", text.lower()).split())
+
+
+def shingles(text, size=5):
+    """Character shingles of the normalized text (the whole text if shorter)."""
+    norm = normalize_text(text)
+    if len(norm) <= size:
+        return {norm}
+    return {norm[i:i + size] for i in range(len(norm) - size + 1)}
+
+
+def signature_text(question, options=()):
+    """The text a question is indexed by: its stem, then its options in sorted order."""
+    return "\n".join([question, *sorted(str(option) for option in options)])
+
+
+class MinHasher:
+    """Computes fixed-length MinHash signatures with universal hashing."""
+
+    def __init__(self, num_perm=64, shingle_size=5, seed=1):
+        rng = random.Random(seed)
+        self.shingle_size = shingle_size
+        self._perms = [
+            (rng.randint(1, _MERSENNE_PRIME - 1), rng.randint(0, _MERSENNE_PRIME - 1))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, text):
+        hashes = [
+            int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+            for s in shingles(text, self.shingle_size)
+        ]
+        return tuple(
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._perms
+        )
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class QuestionSimilarityIndex:
+    """Per-topic store of question signatures with a duplicate check."""
+
+    def __init__(self, threshold=0.5, per_topic=200, max_topics=1000, num_perm=64):
+        self.threshold = threshold
+        self.per_topic = per_topic
+        self.max_topics = max_topics
+        self.hasher = MinHasher(num_perm=num_perm)
+        self._topics = OrderedDict()  # topic_key -> deque[signature]
+        self._lock = threading.Lock()
+
+    def __contains__(self, topic_key):
+        return topic_key in self._topics
+
+    def most_similar(self, topic_key, text, extra=()):
+        """Highest similarity between ``text`` and the topic's stored questions.
+
+        ``extra`` is an iterable of additional signatures to compare against,
+        e.g. questions accepted earlier in the same batch.
+        """
+        sig = self.hasher.signature(text)
+        with self._lock:
+            stored = list(self._topics.get(topic_key, ()))
+        return max((similarity(sig, other) for other in [*stored, *extra]), default=0.0), sig
+
+    def add(self, topic_key, texts):
+        sigs = [self.hasher.signature(t) for t in texts]
+        self.add_signatures(topic_key, sigs)
+
+    def add_signatures(self, topic_key, sigs):
+        with self._lock:
+            entries = self._topics.get(topic_key)
+            if entries is None:
+                entries = self._topics[topic_key] = deque(maxlen=self.per_topic)
+            self._topics.move_to_end(topic_key)
+            entries.extend(sigs)
+            while len(self._topics) > self.max_topics:
+                self._topics.popitem(last=False)
+
+    def filter_new(self, topic_key, questions, key=lambda q: q):
+        """Split questions into (unique, duplicates) and index the unique ones.
+
+        A question is a duplicate if it is too similar to a stored question
+        or to one accepted earlier in the same call.
+        """
+        unique, duplicates, accepted_sigs = [], [], []
+        for q in questions:
+            score, sig = self.most_similar(topic_key, key(q), accepted_sigs)
+            if score >= self.threshold:
+                duplicates.append(q)
+            else:
+                unique.append(q)
+                accepted_sigs.append(sig)
+        self.add_signatures(topic_key, accepted_sigs)
+        return unique, duplicates
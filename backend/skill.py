@@ -0,0 +1,199 @@
+# skill.py
+"""Per-user, per-topic skill ratings that choose quiz difficulty and focus.
+
+Each (user, topic) pair has an Elo rating. Every graded answer counts as a
+match between the student and the question, whose rating comes from its
+difficulty level (Easy 800, Medium 1000, Hard 1200; Mixed counts as 1000).
+The next quiz uses the level whose expected success rate is closest to
+SKILL_TARGET_SUCCESS. Until a student has answered SKILL_MIN_ANSWERS
+questions on a topic they get Mixed, which calibrates the rating quickly.
+
+Each focus area also keeps a moving average of the student's accuracy on
+quizzes that covered it. The weakest areas come back in the next quiz, and
+the remaining slots go to the areas the variation schedule picked.
+
+Ratings live in memory. A (user, topic) pair is loaded from the
+``skill_ratings`` table on first use. Changed ratings are written back in
+one batch by ``checkpoint()``, which runs periodically and on shutdown.
+
+Environment:
+    SKILL_K_FACTOR             Elo step size per answer (default: 32)
+    SKILL_TARGET_SUCCESS       success rate to aim each quiz at (default: 0.6)
+    SKILL_MIN_ANSWERS          answers on a topic before leaving Mixed (default: 5)
+    SKILL_MAX_ENTRIES          (user, topic) ratings kept in memory (default: 100000)
+    SKILL_CHECKPOINT_INTERVAL  seconds between checkpoints (default: 30)
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import SkillRating
+
+INITIAL_RATING = 1000.0
+LEVEL_RATINGS = {"Easy": 800, "Medium": 1000, "Hard": 1200, "Mixed": 1000}
+ADAPTIVE_LEVELS = ("Easy", "Medium", "Hard")
+FOCUS_ALPHA = 0.3       # weight of the latest quiz in a focus area's average
+WEAK_FOCUS_BELOW = 0.7  # areas under this accuracy are revisited
+
+
+def expected_success(rating, level):
+    """Elo probability that a student with ``rating`` answers a ``level`` question."""
+    return 1 / (1 + 10 ** ((LEVEL_RATINGS.get(level, 1000) - rating) / 400))
+
+
+class SkillState:
+    __slots__ = ("rating", "answers", "focus", "updated_at")
+
+    def __init__(self, rating=INITIAL_RATING, answers=0, focus=None, updated_at=None):
+        self.rating = rating
+        self.answers = answers
+        self.focus = focus or {}
+        self.updated_at = updated_at
+
+
+class SkillModel:
+    """In-memory Elo ratings per (user_id, topic_key), checkpointed to SQLite."""
+
+    def __init__(self, session_factory, difficulty_levels, focus_areas, k_factor=32,
+                 target=0.6, min_answers=5, max_entries=100000):
+        self.session_factory = session_factory
+        self.levels = {level["level"]: level for level in difficulty_levels}
+        self.focus_areas = focus_areas
+        self.k_factor = k_factor
+        self.target = target
+        self.min_answers = min_answers
+        self.max_entries = max_entries
+        self._states = OrderedDict()  # (user_id, topic_key) -> SkillState
+        self._dirty = {}              # (user_id, topic_key) -> SkillState, including evicted ones
+        self._lock = threading.Lock()
+
+    def _remember(self, key, state):
+        """Insert a state unless another thread got there first; evict the least recently used."""
+        with self._lock:
+            existing = self._states.get(key)
+            if existing is not None:
+                self._states.move_to_end(key)
+                return existing
+            self._states[key] = state
+            while len(self._states) > self.max_entries:
+                self._states.popitem(last=False)  # dirty ones are still in _dirty
+            return state
+
+    def ensure_loaded(self, user_id, topic_key):
+        """Load a rating from the database on first use. Blocking; call from a thread."""
+        key = (user_id, topic_key)
+        with self._lock:
+            if key in self._states:
+                self._states.move_to_end(key)
+                return self._states[key]
+            pending = self._dirty.get(key)
+        if pending is not None:
+            return self._remember(key, pending)
+        db = self.session_factory()
+        try:
+            row = db.get(SkillRating, key)
+        finally:
+            db.close()
+        state = SkillState()
+        if row is not None:
+            state = SkillState(row.rating, row.answers, json.loads(row.focus_scores or "{}"), row.updated_at)
+        return self._remember(key, state)
+
+    def get(self, user_id, topic_key):
+        with self._lock:
+            return self._states.get((user_id, topic_key))
+
+    def choose(self, user_id, topic_key, default_focuses):
+        """Difficulty level (a DIFFICULTY_LEVELS entry) and focus areas for the next quiz."""
+        state = self.get(user_id, topic_key) or SkillState()
+        if state.answers < self.min_answers:
+            level = "Mixed"
+        else:
+            level = min(ADAPTIVE_LEVELS, key=lambda name: abs(expected_success(state.rating, name) - self.target))
+
+        # Revisit up to all-but-one weak areas; the schedule fills the rest
+        count = len(default_focuses)
+        weak = sorted(
+            (score, area) for area, score in state.focus.items()
+            if score < WEAK_FOCUS_BELOW and area in self.focus_areas
+        )
+        focuses = [area for _, area in weak[:max(0, count - 1)]]
+        focuses += [area for area in default_focuses if area not in focuses][:count - len(focuses)]
+        return self.levels[level], focuses
+
+    def record(self, user_id, topic_key, outcomes, focuses=()):
+        """Update a rating with one quiz's answers, given as (difficulty level, correct) pairs."""
+        if not outcomes:
+            return
+        state = self.ensure_loaded(user_id, topic_key)
+        with self._lock:
+            for level, correct in outcomes:
+                state.rating += self.k_factor * ((1.0 if correct else 0.0) - expected_success(state.rating, level))
+            state.answers += len(outcomes)
+            accuracy = sum(1 for _, correct in outcomes if correct) / len(outcomes)
+            for area in focuses or ():
+                previous = state.focus.get(area)
+                state.focus[area] = accuracy if previous is None else (1 - FOCUS_ALPHA) * previous + FOCUS_ALPHA * accuracy
+            state.updated_at = datetime.utcnow()
+            self._dirty[(user_id, topic_key)] = state
+
+    def checkpoint(self):
+        """Write changed ratings in one batch. Blocking; returns the number written."""
+        with self._lock:
+            batch = [
+                {
+                    "user_id": user_id,
+                    "topic_key": topic_key,
+                    "rating": state.rating,
+                    "answers": state.answers,
+                    "focus_scores": json.dumps(state.focus),
+                    "updated_at": state.updated_at,
+                }
+                for (user_id, topic_key), state in self._dirty.items()
+            ]
+            dirty, self._dirty = self._dirty, {}
+        if not batch:
+            return 0
+        table = SkillRating.__table__
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.topic_key],
+            set_={name: stmt.excluded[name] for name in ("rating", "answers", "focus_scores", "updated_at")}
+        )
+        db = self.session_factory()
+        try:
+            db.execute(stmt, batch)
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                for key, state in dirty.items():
+                    self._dirty.setdefault(key, state)
+            raise
+        finally:
+            db.close()
+        return len(batch)
+
+    @property
+    def dirty(self):
+        return len(self._dirty)
+
+    def __len__(self):
+        return len(self._states)
+
+
+def create_skill_model(session_factory, difficulty_levels, focus_areas):
+    """Build the model with settings from the environment."""
+    return SkillModel(
+        session_factory,
+        difficulty_levels,
+        focus_areas,
+        k_factor=float(os.getenv("SKILL_K_FACTOR", "32")),
+        target=float(os.getenv("SKILL_TARGET_SUCCESS", "0.6")),
+        min_answers=int(os.getenv("SKILL_MIN_ANSWERS", "5")),
+        max_entries=int(os.getenv("SKILL_MAX_ENTRIES", "100000")),
+    )
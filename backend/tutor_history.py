@@ -0,0 +1,120 @@
+# tutor_history.py
+"""Token-budgeted conversation history for the AI tutor.
+
+Clients send the whole chat with every /ai-tutor request. Instead of
+forwarding all of it, the last few turns are kept verbatim and everything
+older is folded into a rolling summary. Summaries are cached per (user,
+conversation), so each older message is summarized once rather than on
+every request, and a hard cap bounds the final prompt size.
+
+A cached summary is only extended if the messages it covers are exactly
+the start of the history sent now (checked by hash). Another conversation
+that happens to share an id or an opening message starts its own summary.
+"""
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+VALID_ROLES = ("user", "assistant")
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (about 4 characters per token for English)."""
+    return len(text) // 4 + 1
+
+
+def message_tokens(message):
+    return estimate_tokens(message["content"]) + 4  # role and framing overhead
+
+
+def clean_history(history):
+    """Keep only well-formed user/assistant messages with text content."""
+    return [
+        {"role": m["role"], "content": m["content"]}
+        for m in history or []
+        if isinstance(m, dict) and m.get("role") in VALID_ROLES and isinstance(m.get("content"), str)
+    ]
+
+
+def fallback_conversation_id(history):
+    """Stable id for clients that do not send one: a hash of the first message."""
+    first = history[0]["content"] if history else ""
+    return "h:" + hashlib.sha1(first.encode("utf-8")).hexdigest()
+
+
+def messages_hash(messages):
+    """Hash of the exact messages a summary was built from."""
+    return hashlib.sha1(json.dumps(messages, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class HistoryCompactor:
+    """Keeps recent turns verbatim and replaces older ones with a cached summary.
+
+    ``summarize`` is an async callable taking (previous_summary, messages)
+    and returning the new summary text.
+    """
+
+    def __init__(self, summarize, keep_messages=8, max_input_tokens=6000,
+                 max_summary_tokens=400, cache_size=2000):
+        self.summarize = summarize
+        self.keep_messages = keep_messages
+        self.max_input_tokens = max_input_tokens
+        self.max_summary_tokens = max_summary_tokens
+        self.cache_size = cache_size
+        self._summaries = OrderedDict()  # (user_id, conversation_id) -> (covered, prefix hash, summary)
+        self._lock = threading.Lock()
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._summaries.get(key)
+            if entry is not None:
+                self._summaries.move_to_end(key)
+            return entry
+
+    def _store(self, key, covered, prefix_hash, summary):
+        with self._lock:
+            self._summaries[key] = (covered, prefix_hash, summary)
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+
+    async def compact(self, history, conversation_id=None, user_id=None, reserved_tokens=0):
+        """Return (summary or None, recent messages) fitting the token budget.
+
+        ``reserved_tokens`` is what the caller still needs for the system
+        prompt and the current question.
+        """
+        history = clean_history(history)
+        split = max(0, len(history) - self.keep_messages)
+        older, recent = history[:split], history[split:]
+
+        summary = None
+        if older:
+            key = (user_id, conversation_id or fallback_conversation_id(history))
+            covered, prefix_hash, summary = self._cached(key) or (0, None, None)
+            if covered > len(older) or (covered and messages_hash(older[:covered]) != prefix_hash):
+                # Not a continuation of what was summarized (another conversation,
+                # or the client reset or edited it): start over
+                covered, summary = 0, None
+            if covered < len(older):
+                try:
+                    summary = await self.summarize(summary, older[covered:])
+                    self._store(key, len(older), messages_hash(older), summary)
+                except Exception as e:
+                    logger.warning("history summary failed, dropping older turns", extra={"error": str(e)})
+                    # Keep whatever summary we already had for the covered part
+            if summary and estimate_tokens(summary) > self.max_summary_tokens:
+                summary = summary[: self.max_summary_tokens * 4]
+
+        # Hard cap: drop the oldest verbatim turns, then the summary
+        budget = self.max_input_tokens - reserved_tokens
+        used = sum(message_tokens(m) for m in recent) + (estimate_tokens(summary) + 4 if summary else 0)
+        while recent and used > budget:
+            used -= message_tokens(recent.pop(0))
+        if summary and used > budget:
+            summary = None
+        return summary, recent
@@ -0,0 +1,60 @@
+# usage.py
+"""LLM token accounting per endpoint.
+
+Routes label themselves with ``set_endpoint`` (main.py does this in its
+rate-limit dependency). llm.py reports the usage block of every completion,
+including the final chunk of a stream, and it is attributed to whichever
+endpoint label is active in the calling context. Work started outside a
+request, such as the bank refill loop, uses its own label.
+
+Environment:
+    LLM_COST_PER_1M_PROMPT_TOKENS      optional price used for cost estimates (default: 0)
+    LLM_COST_PER_1M_COMPLETION_TOKENS  optional price used for cost estimates (default: 0)
+"""
+import contextvars
+import os
+import threading
+from collections import defaultdict
+
+_endpoint = contextvars.ContextVar("llm_endpoint", default="other")
+
+
+def set_endpoint(name):
+    _endpoint.set(name)
+
+
+def current_endpoint():
+    return _endpoint.get()
+
+
+class UsageMeter:
+    """Running totals of LLM calls and tokens per (endpoint, model)."""
+
+    def __init__(self):
+        self._totals = defaultdict(lambda: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        self._lock = threading.Lock()
+
+    def record(self, model, prompt_tokens, completion_tokens, endpoint=None):
+        with self._lock:
+            entry = self._totals[(endpoint or current_endpoint(), model)]
+            entry["calls"] += 1
+            entry["prompt_tokens"] += prompt_tokens or 0
+            entry["completion_tokens"] += completion_tokens or 0
+
+    def snapshot(self):
+        """Totals grouped by endpoint, with an estimated cost when prices are set."""
+        prompt_price = float(os.getenv("LLM_COST_PER_1M_PROMPT_TOKENS", "0"))
+        completion_price = float(os.getenv("LLM_COST_PER_1M_COMPLETION_TOKENS", "0"))
+        report = {}
+        with self._lock:
+            items = [(key, dict(value)) for key, value in self._totals.items()]
+        for (endpoint, model), entry in sorted(items):
+            entry["total_tokens"] = entry["prompt_tokens"] + entry["completion_tokens"]
+            entry["estimated_cost_usd"] = round(
+                (entry["prompt_tokens"] * prompt_price + entry["completion_tokens"] * completion_price) / 1e6, 6
+            )
+            report.setdefault(endpoint, {})[model] = entry
+        return report
+
+
+meter = UsageMeter()
@@ -0,0 +1,123 @@
+# variation.py
+"""Per-request randomness and the quiz variation schedule.
+
+Nothing here touches the process-global ``random`` state, which concurrent
+requests would otherwise reseed under each other:
+
+* ``request_rng`` builds a private Random from a request's seed, so the
+  same seed always makes the same choices.
+* ``new_seed`` draws a seed for an unseeded request from the OS.
+* ``VariationScheduler`` walks every (style, difficulty) pair and every
+  focus area in a fixed order per (user, topic). Everyone starts a topic
+  at the same slot, derived from the topic, so a class asking for the same
+  topic at once gets the same variation and shares one generation and one
+  bank key. One user never repeats a pair on a topic until they have seen
+  them all.
+* ``SeededQuizCache`` remembers the quiz returned for a seeded request
+  (its questions and their bank ids), so repeating the request returns
+  exactly the same questions.
+"""
+import copy
+import random
+import threading
+import zlib
+from collections import OrderedDict
+
+_system_random = random.SystemRandom()
+
+
+def request_rng(*parts):
+    """A private Random seeded from ``parts``, e.g. ``request_rng(seed, attempt)``."""
+    return random.Random(":".join(str(part) for part in parts))
+
+
+def new_seed():
+    return _system_random.randint(1, 1000000)
+
+
+class VariationScheduler:
+    """Deterministic per-key cycle over question styles, difficulties and focus areas.
+
+    Slot ``n`` maps to style ``n % S`` and difficulty ``(n % S + n // S) % D``,
+    so S * D consecutive slots cover every pair once and neighbouring slots
+    differ in both. Focus areas advance ``focus_count`` at a time, so every
+    area comes up equally often.
+    """
+
+    def __init__(self, question_types, difficulty_levels, focus_areas, focus_count=3, max_keys=100000):
+        self.question_types = question_types
+        self.difficulty_levels = difficulty_levels
+        self.focus_areas = focus_areas
+        self.focus_count = min(focus_count, len(focus_areas))
+        self.max_keys = max_keys
+        self.size = len(question_types) * len(difficulty_levels) * len(focus_areas)
+        self._next_slot = OrderedDict()  # key -> next slot
+        self._lock = threading.Lock()
+
+    def at(self, slot):
+        """The (question_type, difficulty, focuses) chosen for ``slot``."""
+        styles = len(self.question_types)
+        style = slot % styles
+        level = (style + slot // styles) % len(self.difficulty_levels)
+        first = slot * self.focus_count
+        focuses = [self.focus_areas[(first + i) % len(self.focus_areas)] for i in range(self.focus_count)]
+        return self.question_types[style], self.difficulty_levels[level], focuses
+
+    def next(self, key, start_key=None):
+        """Advance ``key`` by one slot, e.g. ``next((user_id, topic), topic)``.
+
+        A new key starts at the slot derived from ``start_key`` (default:
+        the key itself), so keys sharing a start_key begin in step.
+        """
+        with self._lock:
+            slot = self._next_slot.pop(key, None)
+            if slot is None:
+                slot = zlib.crc32(repr(key if start_key is None else start_key).encode()) % self.size
+            self._next_slot[key] = (slot + 1) % self.size
+            while len(self._next_slot) > self.max_keys:
+                self._next_slot.popitem(last=False)
+        return self.at(slot)
+
+    def seeded(self, *parts):
+        """The slot chosen by ``request_rng(*parts)``; same parts, same variation."""
+        return self.at(request_rng(*parts).randrange(self.size))
+
+    def __len__(self):
+        return len(self._next_slot)
+
+
+class SeededQuizCache:
+    """LRU of quizzes returned for seeded requests."""
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (questions, question_ids)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return a copy of the cached (questions, question_ids) for ``key``, or None."""
+        with self._lock:
+            quiz = self._entries.get(key)
+            if quiz is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(quiz)
+
+    def add(self, key, quiz):
+        """Remember the first quiz returned for ``key``; later ones do not replace it."""
+        questions, question_ids = quiz
+        if self.max_entries <= 0 or not question_ids:
+            return
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = copy.deepcopy((questions, question_ids))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
@@ -4,6 +4,7 @@ import Login from "./components/Login";
 import Register from "./components/Register";
 import Quiz from "./components/Quiz";
 import AITutor from "./components/AITutor";
+import { authHeaders } from "./utils/api";
 
 function App() {
   const [user, setUser] = useState(null);
@@ -21,6 +22,9 @@ function App() {
   };
 
   const handleLogout = () => {
+    // Revoke the session token on the server; ignore network errors
+    fetch("http://127.0.0.1:8000/logout", { method: "POST", headers: authHeaders() }).catch(() => {});
+    localStorage.removeItem("token");
     setUser(null);
     setTopic("");
     setShowRegister(false);
@@ -1,6 +1,8 @@
 // src/components/AITutor.js
 import React, { useState, useRef, useEffect } from "react";
 import { Send, LogOut, BookOpen, User, Bot } from "lucide-react";
+import { readSSE } from "../utils/sse";
+import { authHeaders } from "../utils/api";
 
 function AITutor({ onSelectTopic, user, onLogout }) {
   const [messages, setMessages] = useState([
@@ -19,8 +21,11 @@ Let’s begin 🚀`,
 
   const [inputValue, setInputValue] = useState("");
   const [loading, setLoading] = useState(false);
+  const [streaming, setStreaming] = useState(false);
   const [currentTopic, setCurrentTopic] = useState("");
   const messagesEndRef = useRef(null);
+  // Lets the backend cache a summary of older turns for this chat
+  const conversationId = useRef(`${Date.now()}-${Math.random().toString(36).slice(2)}`);
 
   useEffect(() => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -35,26 +40,41 @@ Let’s begin 🚀`,
     setLoading(true);
 
     try {
-      const response = await fetch("http://localhost:8000/ai-tutor", {
+      const response = await fetch("http://localhost:8000/ai-tutor/stream", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: authHeaders(),
         body: JSON.stringify({
           question: userMessage,
           conversation_history: messages,
+          conversation_id: conversationId.current,
         }),
       });
 
-      const data = await response.json();
-
-      if (response.ok) {
-        setMessages((prev) => [
-          ...prev,
-          { role: "assistant", content: data.answer },
-        ]);
-        setCurrentTopic(userMessage);
-      } else {
+      if (!response.ok || !response.body) {
         throw new Error();
       }
+
+      // Append an empty assistant message and grow it as tokens arrive
+      setMessages((prev) => [...prev, { role: "assistant", content: "" }]);
+      const appendToAnswer = (text) =>
+        setMessages((prev) => {
+          const updated = [...prev];
+          const last = updated[updated.length - 1];
+          updated[updated.length - 1] = { ...last, content: last.content + text };
+          return updated;
+        });
+
+      await readSSE(response, (event, payload) => {
+        if (event === "error") {
+          appendToAnswer(`\n\n⚠️ ${payload.detail || "Unable to fetch response."}`);
+          return true;
+        }
+        if (event === "done") return true;
+        setStreaming(true);
+        appendToAnswer(payload.delta);
+        return false;
+      });
+      setCurrentTopic(userMessage);
     } catch {
       setMessages((prev) => [
         ...prev,
@@ -62,6 +82,7 @@ Let’s begin 🚀`,
       ]);
     } finally {
       setLoading(false);
+      setStreaming(false);
     }
   };
 
@@ -158,7 +179,7 @@ Let’s begin 🚀`,
               </div>
             ))}
 
-            {loading && (
+            {loading && !streaming && (
               <p className="text-sm text-gray-400 italic">
                 AI is thinking...
               </p>
@@ -28,6 +28,9 @@ function Login({ onLoginSuccess, onSwitchToRegister }) {
       const data = await res.json();
 
       if (data.user) {
+        if (data.token) {
+          localStorage.setItem("token", data.token);
+        }
         onLoginSuccess(data.user);
       } else {
         setError(data.message || "Invalid email or password");
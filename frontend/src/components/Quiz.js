@@ -1,5 +1,7 @@
 // src/components/Quiz.js
 import React, { useEffect, useState, useCallback } from "react";
+import { readSSE } from "../utils/sse";
+import { authHeaders } from "../utils/api";
 
 function Quiz({ topic, user, onBackToTutor, onLogout }) {
   const [questions, setQuestions] = useState([]);
@@ -12,6 +14,9 @@ function Quiz({ topic, user, onBackToTutor, onLogout }) {
   const [score, setScore] = useState(0);
   const [feedback, setFeedback] = useState("");
   const [quizAttempt, setQuizAttempt] = useState(1);
+  const [generating, setGenerating] = useState(false);
+  const [expectedCount, setExpectedCount] = useState(0);
+  const [sessionId, setSessionId] = useState(null);
 
   const generateQuiz = useCallback(async () => {
     setLoading(true);
@@ -23,10 +28,13 @@ function Quiz({ topic, user, onBackToTutor, onLogout }) {
     setScore(0);
     setFeedback("");
     setSelectedAnswer("");
+    setSessionId(null);
+    setGenerating(true);
+    setExpectedCount(0);
 
     try {
       const timestamp = Date.now();
-      const randomSeed = Math.floor(Math.random() * 1000000);
+      const nonce = Math.floor(Math.random() * 1000000);
       const difficultyLevels = ["easy", "medium", "hard", "mixed"];
       const randomDifficulty = difficultyLevels[Math.floor(Math.random() * difficultyLevels.length)];
       
@@ -43,33 +51,59 @@ function Quiz({ topic, user, onBackToTutor, onLogout }) {
         topic, 
         num_questions: 5,
         timestamp,
-        seed: randomSeed,
+        // No seed: the backend picks the next style, difficulty and focus for this user.
+        // Send one only to reproduce an exact quiz.
         attempt: quizAttempt,
         difficulty: randomDifficulty,
         variation_prompt: randomPrompt,
-        request_id: `${topic}-${timestamp}-${randomSeed}`,
-        force_new: true
+        request_id: `${topic}-${timestamp}-${nonce}`,
+        // The backend only serves bank questions this user (from the auth token) has not seen yet
+        force_new: false
       };
       
-      const response = await fetch("http://localhost:8000/ai-questions", {
+      const response = await fetch("http://localhost:8000/ai-questions/stream", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: authHeaders(),
         body: JSON.stringify(requestBody),
       });
 
-      const data = await response.json();
-
-      if (response.ok && data.questions && data.questions.length > 0) {
-        setQuestions(data.questions);
-      } else {
+      if (!response.ok || !response.body) {
+        const data = await response.json().catch(() => ({}));
         setError(data.error || data.detail || "Failed to generate quiz. Please try again.");
+        return;
+      }
+
+      // Show the first question as soon as it arrives; the rest stream in behind it
+      let received = 0;
+      await readSSE(response, (event, payload) => {
+        if (event === "meta") {
+          setExpectedCount(payload.num_questions);
+        } else if (event === "question") {
+          received += 1;
+          setQuestions((prev) => [...prev, payload.question]);
+          setLoading(false);
+        } else if (event === "error") {
+          // Without a session the quiz cannot be graded, even if some questions arrived
+          setError(payload.detail || "Failed to generate quiz. Please try again.");
+          return true;
+        } else if (event === "done") {
+          // Answers stay on the server; this session is submitted for grading
+          setSessionId(payload.session_id);
+          return true;
+        }
+        return false;
+      });
+
+      if (received === 0) {
+        setError((prev) => prev || "Failed to generate quiz. Please try again.");
       }
     } catch (err) {
       setError("Connection error. Make sure backend is running on http://localhost:8000");
     } finally {
       setLoading(false);
+      setGenerating(false);
     }
-  }, [topic, quizAttempt]);
+  }, [topic, quizAttempt, user]);
 
   useEffect(() => {
     if (topic) {
@@ -96,17 +130,30 @@ function Quiz({ topic, user, onBackToTutor, onLogout }) {
 
   const calculateScore = async (answers) => {
     let correctCount = 0;
-    questions.forEach((question, index) => {
-      if (answers[index] === question.correct_answer) {
-        correctCount++;
+    try {
+      const response = await fetch(`http://localhost:8000/quiz-sessions/${sessionId}/submit`, {
+        method: "POST",
+        headers: authHeaders(),
+        body: JSON.stringify({ answers }),
+      });
+      const data = await response.json();
+      if (!response.ok) {
+        setError(data.detail || "Failed to submit quiz. Please try again.");
+        return;
       }
-    });
-    setScore(correctCount);
+      correctCount = data.score;
+      // Graded results carry the correct answer and explanation for review
+      setQuestions((prev) => prev.map((question, index) => ({ ...question, ...data.results[index] })));
+      setScore(correctCount);
+    } catch (err) {
+      setError("Connection error. Make sure backend is running on http://localhost:8000");
+      return;
+    }
 
     try {
       const response = await fetch("http://localhost:8000/quiz-feedback", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: authHeaders(),
         body: JSON.stringify({
           score: correctCount,
           total: questions.length,
@@ -193,7 +240,7 @@ function Quiz({ topic, user, onBackToTutor, onLogout }) {
               </h3>
               {questions.map((question, index) => {
                 const userAnswer = userAnswers[index];
-                const isCorrect = userAnswer === question.correct_answer;
+                const isCorrect = question.is_correct;
                 return (
                   <div key={index} className="bg-gray-50 border-2 border-gray-200 rounded-2xl p-6 hover:shadow-lg transition-all">
                     <div className="flex items-start gap-4 mb-4">
@@ -226,6 +273,8 @@ function Quiz({ topic, user, onBackToTutor, onLogout }) {
 
   // Quiz taking screen
   const currentQuestion = questions[currentQuestionIndex];
+  const totalQuestions = generating ? Math.max(expectedCount, questions.length) : questions.length;
+  const waitingForNext = generating && currentQuestionIndex >= questions.length - 1;
   return (
     <div className="min-h-screen bg-white">
       <div className="bg-white shadow-md border-b-2 border-gray-200">
@@ -244,10 +293,10 @@ function Quiz({ topic, user, onBackToTutor, onLogout }) {
         <div className="bg-white rounded-3xl shadow-2xl p-10 border-2 border-gray-200">
           <div className="mb-8">
             <div className="flex justify-between items-center mb-5">
-              <span className="text-lg font-bold text-gray-800">Question {currentQuestionIndex + 1} of {questions.length}</span>
-              <div className="bg-indigo-100 px-5 py-2 rounded-full border-2 border-indigo-200"><span className="text-indigo-700 font-bold">Progress: {Math.round(((currentQuestionIndex + 1) / questions.length) * 100)}%</span></div>
+              <span className="text-lg font-bold text-gray-800">Question {currentQuestionIndex + 1} of {totalQuestions}</span>
+              <div className="bg-indigo-100 px-5 py-2 rounded-full border-2 border-indigo-200"><span className="text-indigo-700 font-bold">Progress: {Math.round(((currentQuestionIndex + 1) / totalQuestions) * 100)}%</span></div>
             </div>
-            <div className="w-full bg-gray-200 rounded-full h-4 overflow-hidden border-2 border-gray-300"><div className="h-full bg-gradient-to-r from-indigo-600 to-indigo-700 rounded-full transition-all duration-500" style={{ width: `${((currentQuestionIndex + 1) / questions.length) * 100}%` }}></div></div>
+            <div className="w-full bg-gray-200 rounded-full h-4 overflow-hidden border-2 border-gray-300"><div className="h-full bg-gradient-to-r from-indigo-600 to-indigo-700 rounded-full transition-all duration-500" style={{ width: `${((currentQuestionIndex + 1) / totalQuestions) * 100}%` }}></div></div>
           </div>
           <h2 className="text-2xl font-bold text-gray-800 mb-8 leading-relaxed">{currentQuestion.question}</h2>
           <div className="space-y-4 mb-10">
@@ -258,8 +307,8 @@ function Quiz({ topic, user, onBackToTutor, onLogout }) {
               </button>
             ))}
           </div>
-          <button onClick={handleNextQuestion} disabled={!selectedAnswer} className="w-full py-5 bg-gradient-to-r from-amber-500 to-amber-600 text-white rounded-xl font-bold text-xl hover:from-amber-600 hover:to-amber-700 transition-all shadow-lg hover:shadow-2xl disabled:opacity-50 disabled:cursor-not-allowed transform hover:scale-[1.02] active:scale-[0.98] flex items-center justify-center gap-3">
-            <span>{currentQuestionIndex < questions.length - 1 ? "Next Question" : "Submit Quiz"}</span>
+          <button onClick={handleNextQuestion} disabled={!selectedAnswer || waitingForNext || (!sessionId && currentQuestionIndex >= questions.length - 1)} className="w-full py-5 bg-gradient-to-r from-amber-500 to-amber-600 text-white rounded-xl font-bold text-xl hover:from-amber-600 hover:to-amber-700 transition-all shadow-lg hover:shadow-2xl disabled:opacity-50 disabled:cursor-not-allowed transform hover:scale-[1.02] active:scale-[0.98] flex items-center justify-center gap-3">
+            <span>{waitingForNext ? "Generating next question..." : currentQuestionIndex < questions.length - 1 ? "Next Question" : "Submit Quiz"}</span>
             <svg className="w-6 h-6" fill="none" stroke="currentColor" viewBox="0 0 24 24"><path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M13 7l5 5m0 0l-5 5m5-5H6" /></svg>
           </button>
         </div>
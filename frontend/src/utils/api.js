@@ -0,0 +1,11 @@
+// src/utils/api.js
+
+// Headers for JSON requests to the backend, including the signed session
+// token saved at sign-in.
+export function authHeaders() {
+  const token = localStorage.getItem("token");
+  return {
+    "Content-Type": "application/json",
+    ...(token ? { Authorization: `Bearer ${token}` } : {}),
+  };
+}